@@ -9,11 +9,21 @@
 - 数据模块 API (databoard-data)
 """
 
+import importlib
+import logging
 import os
 import sys
-import json
-from flask import Flask
-from flask_cors import CORS
+
+import orjson
+from flask import Flask, Response, request
+from flask.json.provider import DefaultJSONProvider
+
+from backend_api.http_cache import apply_weak_etag
+
+try:
+    from flask_compress import Compress
+except ImportError:  # 可选依赖：未安装时不压缩响应
+    Compress = None
 
 # 确保可以导入项目根目录下的 infra 包
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -38,7 +48,15 @@ def _load_env_file(path: str) -> list[str]:
     return loaded_keys
 
 
-def _load_env() -> None:
+_ENV_LOADED_FLAG = "ZZ_ENV_LOADED"
+
+
+def _load_env() -> list[str]:
+    # 父进程（如 gunicorn --preload 的 master）已加载过 .env 时，子进程直接继承环境变量
+    # LOG_LEVEL 可能来自 .env，日志尚未配置，加载情况先收集起来，配置好日志后再输出
+    if os.getenv(_ENV_LOADED_FLAG):
+        return []
+    notes = []
     base_dir = os.path.dirname(__file__)
     root_dir = os.path.abspath(os.path.join(base_dir, ".."))
     env_paths = [
@@ -46,87 +64,221 @@ def _load_env() -> None:
         os.path.join(root_dir, ".env"),
     ]
     for path in env_paths:
+        if not os.path.isfile(path):
+            continue
         loaded = _load_env_file(path)
-        if os.path.isfile(path):
-            if loaded:
-                print(f"[INFO] loaded env file: {path} ({len(loaded)} keys)")
-            else:
-                print(f"[INFO] env file present but no new keys loaded: {path}")
-
-
-_load_env()
-
-if os.getenv("TAVILY_API_KEY"):
-    print("[INFO] TAVILY_API_KEY detected")
-else:
-    print("[WARN] TAVILY_API_KEY not set")
-
-# 导入各个Blueprint
-from backend_api.daily_report_bp import daily_report_bp
-from backend_api.data_cards_bp import data_cards_bp
-from backend_api.news_bp import news_bp
-from backend_api.databoard_map_bp import databoard_map_bp
-from backend_api.databoard_data_bp import databoard_data_bp
-from backend_api.agent_report_bp import agent_report_bp, get_agent_initial_report
-from backend_api.agent_chat_bp import agent_chat_bp
-from backend_api.user_bp import user_bp
-
-# 创建Flask应用
-app = Flask(__name__)
-
-# 配置 JSON 编码，支持中文显示
-app.config['JSON_AS_ASCII'] = False
-app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
-
-# 自定义 JSON 编码器，确保中文字符正确显示
-class CustomJSONEncoder(json.JSONEncoder):
-    def __init__(self, **kwargs):
-        kwargs['ensure_ascii'] = False
-        super(CustomJSONEncoder, self).__init__(**kwargs)
-
-app.json_encoder = CustomJSONEncoder
-
-# 配置 CORS 解决跨域问题
-CORS(app, 
-        origins=['http://localhost:9528', 'http://127.0.0.1:9528', 'http://localhost:3000', 'http://127.0.0.1:3000', 'http://116.62.34.152:7002'],
-     methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization', 'X-Requested-With', 'X-Token'],
-     supports_credentials=True)
-
-# 注册Blueprint
-app.register_blueprint(daily_report_bp, url_prefix='/api/dashboard')
-app.register_blueprint(data_cards_bp, url_prefix='/api/dashboard')
-app.register_blueprint(news_bp, url_prefix='/api/dashboard')
-app.register_blueprint(databoard_map_bp, url_prefix='/api/databoard/map')
-app.register_blueprint(databoard_data_bp, url_prefix='/api/databoard/data')
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(agent_report_bp, url_prefix='/api/agent')
-app.register_blueprint(agent_chat_bp, url_prefix='/api/agent')
-
-# 兼容旧路径：/agent/initial-report
-@app.route("/agent/initial-report", methods=["GET"])
-def agent_initial_report_alias():
-    return get_agent_initial_report()
-
-# 健康检查接口
-@app.route("/healthz", methods=["GET"])
+        if loaded:
+            notes.append(f"loaded env file: {path} ({len(loaded)} keys)")
+        else:
+            notes.append(f"env file present but no new keys loaded: {path}")
+    os.environ[_ENV_LOADED_FLAG] = "1"
+    return notes
+
+
+_env_notes = _load_env()
+
+# 日志级别：LOG_LEVEL 优先，调试模式（FLASK_DEBUG=1）默认 DEBUG，否则 INFO；gunicorn 部署同样生效
+_log_level = logging.getLevelName(
+    (os.getenv("LOG_LEVEL") or ("DEBUG" if os.getenv("FLASK_DEBUG") == "1" else "INFO")).upper()
+)
+logging.basicConfig(
+    level=_log_level if isinstance(_log_level, int) else logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+logger = logging.getLogger(__name__)
+for _note in _env_notes:
+    logger.info(_note)
+
+
+def _warn_missing_keys() -> None:
+    """启动自检：只提示，不影响启动（由 create_app 调用，不在导入阶段执行）"""
+    if os.getenv("TAVILY_API_KEY"):
+        logger.info("TAVILY_API_KEY detected")
+    else:
+        logger.warning("TAVILY_API_KEY not set")
+
+# Blueprint 注册表：(模块路径, Blueprint 变量名, URL 前缀)
+# 模块由 _register_blueprints 导入，只导入所选 APP_PROFILE 包含的模块；
+# 模块级 app（gunicorn app:app、--preload）按 APP_PROFILE 创建，默认 full 仍会导入全部模块，
+# 只有 APP_PROFILE=basic 时才跳过智能体相关模块及其依赖
+BLUEPRINTS = [
+    ("backend_api.daily_report_bp", "daily_report_bp", "/api/dashboard"),
+    ("backend_api.data_cards_bp", "data_cards_bp", "/api/dashboard"),
+    ("backend_api.news_bp", "news_bp", "/api/dashboard"),
+    ("backend_api.databoard_map_bp", "databoard_map_bp", "/api/databoard/map"),
+    ("backend_api.databoard_data_bp", "databoard_data_bp", "/api/databoard/data"),
+    ("backend_api.user_bp", "user_bp", "/api"),
+    ("backend_api.agent_report_bp", "agent_report_bp", "/api/agent"),
+    ("backend_api.agent_chat_bp", "agent_chat_bp", "/api/agent"),
+]
+
+# 部署形态（APP_PROFILE）：basic 只含看板/数据/用户模块，full 额外加载智能体模块
+PROFILES = {
+    "basic": BLUEPRINTS[:6],
+    "full": BLUEPRINTS,
+}
+
+
+def _register_blueprints(flask_app: Flask, blueprints) -> None:
+    for module_name, attr, url_prefix in blueprints:
+        module = importlib.import_module(module_name)
+        flask_app.register_blueprint(getattr(module, attr), url_prefix=url_prefix)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """基于 orjson 的 JSON Provider：C 实现序列化，中文原样输出 UTF-8"""
+
+    # datetime 交给 Flask 默认的 default() 处理，保持与原 jsonify 输出一致
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = self.option
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        # request.get_json() 经由 app.json.loads 解析请求体
+        return orjson.loads(s)
+
+
+# 健康检查 / 首页内容固定，启动时序列化一次，请求时直接返回字节
+_HEALTHZ_BODY = orjson.dumps({"ok": True, "service": "unified-api"})
+_INDEX_BODY = orjson.dumps({
+    "message": "统一API服务",
+    "services": [
+        "每日AI简报: /api/dashboard/daily-report",
+        "KPI概览: /api/dashboard/data-cards",
+        "新闻服务: /api/dashboard/news",
+        "地图模块: /api/databoard/map",
+        "数据模块: /api/databoard/data",
+        "用户认证: /api/user/login, /api/user/info, /api/user/logout",
+        "智能体聊天: /api/agent/chat, /api/agent/chat/stream"
+    ]
+})
+
+
 def healthz():
-    return {"ok": True, "service": "unified-api"}
+    return Response(_HEALTHZ_BODY, mimetype="application/json")
+
 
-@app.route("/", methods=["GET"])
 def index():
-    return {
-        "message": "统一API服务",
-        "services": [
-            "每日AI简报: /api/dashboard/daily-report",
-            "KPI概览: /api/dashboard/data-cards", 
-            "新闻服务: /api/dashboard/news",
-            "地图模块: /api/databoard/map",
-            "数据模块: /api/databoard/data",
-            "用户认证: /api/user/login, /api/user/info, /api/user/logout",
-            "智能体聊天: /api/agent/chat, /api/agent/chat/stream"
-        ]
-    }
+    return Response(_INDEX_BODY, mimetype="application/json")
+
+
+# 可被浏览器 / 反向代理缓存的 GET 接口：endpoint -> max-age（秒）
+# daily-report 依赖进程内可修改的 CURRENT_VIEW，不在此列
+HTTP_CACHE_MAX_AGE = {
+    "healthz": 5,
+    "index": 60,
+    "data_cards.get_data_cards_latest": 60,
+    "data_cards.get_data_cards_trend": 60,
+    "news.get_news_list": 60,
+    "news.get_news_detail": 60,
+}
+
+
+def _apply_http_cache(response: Response) -> Response:
+    """为白名单 GET 接口补充 Cache-Control + 弱 ETag，命中 If-None-Match 时直接返回 304"""
+    if request.method != "GET" or response.status_code != 200 or response.is_streamed:
+        return response
+    max_age = HTTP_CACHE_MAX_AGE.get(request.endpoint)
+    if max_age is None:
+        return response
+    return apply_weak_etag(
+        response, f"public, max-age={max_age}, stale-while-revalidate={max_age * 2}"
+    )
+
+
+# ===== CORS 配置 =====
+# 固定白名单直接用 frozenset 匹配，预检请求在 before_request 中直接应答
+CORS_ORIGINS = frozenset([
+    "http://localhost:9528",
+    "http://127.0.0.1:9528",
+    "http://localhost:3000",
+    "http://127.0.0.1:3000",
+    "http://116.62.34.152:7002",
+])
+_CORS_PREFLIGHT_HEADERS = {
+    "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Requested-With, X-Token",
+    # 预检结果缓存 24h，避免每次跨域写请求都多一次 OPTIONS
+    "Access-Control-Max-Age": "86400",
+}
+
+
+def _cors_preflight():
+    if request.method != "OPTIONS":
+        return None
+    response = Response(status=204)
+    if request.headers.get("Origin") in CORS_ORIGINS:
+        response.headers.update(_CORS_PREFLIGHT_HEADERS)
+    return response
+
+
+def _cors_headers(response: Response) -> Response:
+    origin = request.headers.get("Origin")
+    if origin in CORS_ORIGINS:
+        headers = response.headers
+        headers["Access-Control-Allow-Origin"] = origin
+        headers["Access-Control-Allow-Credentials"] = "true"
+        headers.add("Vary", "Origin")
+    return response
+
+
+def create_app(profile: str = "full") -> Flask:
+    """按部署形态创建 Flask 应用；JSON Provider / CORS / 公共路由只在这里配置一次"""
+    if profile not in PROFILES:
+        raise ValueError(f"unknown APP_PROFILE: {profile} (可选: {', '.join(PROFILES)})")
+
+    flask_app = Flask(__name__)
+    flask_app.json = OrjsonProvider(flask_app)
+
+    # 响应压缩：须在其它 after_request 之前初始化，使其最后执行（ETag 按未压缩内容计算）
+    # SSE 流式响应不压缩，否则分块会被缓冲
+    if Compress is not None:
+        flask_app.config.update(
+            COMPRESS_ALGORITHM=["br", "gzip"],
+            COMPRESS_MIN_SIZE=1024,
+            COMPRESS_LEVEL=4,
+            COMPRESS_BR_LEVEL=4,
+            COMPRESS_STREAMS=False,
+        )
+        Compress(flask_app)
+
+    # 注册Blueprint
+    _register_blueprints(flask_app, PROFILES[profile])
+
+    # 兼容旧路径：/agent/initial-report，直接复用 Blueprint 中的视图函数，不再包一层转发
+    report_view = flask_app.view_functions.get("agent_report.get_agent_initial_report")
+    if report_view is not None:
+        flask_app.add_url_rule(
+            "/agent/initial-report",
+            endpoint="agent_initial_report_alias",
+            view_func=report_view,
+            methods=["GET"],
+        )
+
+    # 健康检查接口
+    flask_app.add_url_rule("/healthz", view_func=healthz, methods=["GET"])
+    flask_app.add_url_rule("/", view_func=index, methods=["GET"])
+
+    # 配置 CORS 解决跨域问题
+    flask_app.before_request(_cors_preflight)
+    flask_app.after_request(_apply_http_cache)
+    flask_app.after_request(_cors_headers)
+
+    # 预先编译路由规则，首个请求不再承担 url_map 的构建开销
+    flask_app.url_map.update()
+    flask_app.url_map.bind("localhost").match("/healthz", method="GET")
+
+    _warn_missing_keys()
+    return flask_app
+
+
+# 创建Flask应用（gunicorn app:app 入口）
+# 所有入口（gunicorn app:app / python app.py）都经由这里，APP_PROFILE 决定实际导入哪些 Blueprint
+app = create_app(os.getenv("APP_PROFILE", "full"))
 
 if __name__ == "__main__":
     import argparse
@@ -136,13 +288,19 @@ if __name__ == "__main__":
     args = parser.parse_args()
     port = args.port
 
-    print(f"✅ 启动统一API服务：http://127.0.0.1:{port}")
-    print(f"📊 每日AI简报: http://127.0.0.1:{port}/api/dashboard/daily-report")
-    print(f"📈 KPI概览: http://127.0.0.1:{port}/api/dashboard/data-cards")
-    print(f"📰 新闻服务: http://127.0.0.1:{port}/api/dashboard/news")
-    print(f"🗺️ 地图模块: http://127.0.0.1:{port}/api/databoard/map")
-    print(f"📊 数据模块: http://127.0.0.1:{port}/api/databoard/data")
-    print(f"👤 用户认证: http://127.0.0.1:{port}/api/user/login")
-    print(f"💬 智能体聊天: http://127.0.0.1:{port}/api/agent/chat")
+    # 启动信息一次性输出；gunicorn 部署不会执行此入口
+    base = f"http://127.0.0.1:{port}"
+    logging.getLogger(__name__).info("\n".join([
+        f"✅ 启动统一API服务：{base}",
+        f"📊 每日AI简报: {base}/api/dashboard/daily-report",
+        f"📈 KPI概览: {base}/api/dashboard/data-cards",
+        f"📰 新闻服务: {base}/api/dashboard/news",
+        f"🗺️ 地图模块: {base}/api/databoard/map",
+        f"📊 数据模块: {base}/api/databoard/data",
+        f"👤 用户认证: {base}/api/user/login",
+        f"💬 智能体聊天: {base}/api/agent/chat",
+    ]))
 
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # 仅本地开发入口；调试模式需显式开启（FLASK_DEBUG=1），且不启用 reloader 子进程
+    debug = os.getenv("FLASK_DEBUG") == "1"
+    app.run(host="0.0.0.0", port=port, debug=debug, use_reloader=False, threaded=True)
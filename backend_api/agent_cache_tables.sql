@@ -26,6 +26,33 @@ create index if not exists idx_agent_daily_report_cache_updated_at
 --   alter table agent_daily_report_cache alter column id set not null;
 --   alter table agent_daily_report_cache add primary key (id);
 
+-- Daily report refresh lease (one generator across workers / instances)
+create table if not exists agent_report_refresh_lease (
+  lease_key text primary key,
+  holder text not null,
+  expires_at timestamptz not null
+);
+
+-- Returns true when p_holder got the lease (no row yet, or the previous lease expired).
+create or replace function try_acquire_report_refresh_lease(
+  p_lease_key text,
+  p_holder text,
+  p_ttl_seconds integer
+)
+returns boolean
+language plpgsql
+as $$
+begin
+  insert into agent_report_refresh_lease as l (lease_key, holder, expires_at)
+  values (p_lease_key, p_holder, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (lease_key) do update
+     set holder = excluded.holder,
+         expires_at = excluded.expires_at
+   where l.expires_at <= now();
+  return found;
+end;
+$$;
+
 -- Web search cache (query-level, TTL via expires_at)
 create table if not exists agent_web_search_cache (
   id bigserial primary key,
@@ -41,3 +68,51 @@ create index if not exists idx_agent_web_search_cache_hash
 
 create index if not exists idx_agent_web_search_cache_expires
   on agent_web_search_cache (expires_at);
+
+-- Shared semantic chat cache (pgvector, near-duplicate questions)
+-- vector(1536) must match the dimension returned by infra.embeddings.embed.
+create extension if not exists vector;
+
+create table if not exists agent_chat_semantic_cache (
+  id bigserial primary key,
+  context_key text not null,
+  query text not null,
+  embedding vector(1536) not null,
+  response text not null,
+  hits integer not null default 0,
+  created_at timestamptz not null default now(),
+  expires_at timestamptz not null
+);
+
+create index if not exists idx_agent_chat_semantic_cache_embedding
+  on agent_chat_semantic_cache using ivfflat (embedding vector_cosine_ops) with (lists = 100);
+
+create index if not exists idx_agent_chat_semantic_cache_context
+  on agent_chat_semantic_cache (context_key, expires_at);
+
+create or replace function match_chat_semantic_cache(
+  p_context_key text,
+  p_embedding vector(1536),
+  p_threshold float
+)
+returns table (id bigint, response text, similarity float)
+language plpgsql
+as $$
+begin
+  return query
+  with best as (
+    select c.id, c.response, 1 - (c.embedding <=> p_embedding) as similarity
+    from agent_chat_semantic_cache c
+    where c.context_key = p_context_key
+      and c.expires_at > now()
+    order by c.embedding <=> p_embedding
+    limit 1
+  )
+  update agent_chat_semantic_cache c
+     set hits = c.hits + 1
+    from best
+   where c.id = best.id
+     and best.similarity >= p_threshold
+  returning c.id, c.response, best.similarity;
+end;
+$$;
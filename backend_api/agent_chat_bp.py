@@ -15,34 +15,49 @@
   - 智能路由：自动或手动选择合适的服务（GPT-Researcher/DeepAnalyze/Default LLM）
 """
 
+import atexit
+import logging
 import os
-import json
+import queue
+import re
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import orjson
 import requests
-from flask import Blueprint, request, make_response, stream_with_context, jsonify
+from flask import Blueprint, Response, request, make_response, stream_with_context, jsonify
+
+try:
+    import redis
+except ImportError:  # 可选依赖：未安装时历史记录直接查询 Supabase
+    redis = None
+
+try:
+    import httpx
+except ImportError:  # supabase-py 的依赖；缺失时保持客户端默认连接池
+    httpx = None
 
-from infra.db import supabase
 from infra.llm import call_volcano_chat as llm_chat
 
 # 导入配置模块
-from config import build_system_prompt, get_default_options
+from config import build_system_prompt_cached, get_default_options
 
-# 导入 GPT-Researcher 适配器
-from backend_api.gpt_researcher_adapter import (
-    get_gpt_researcher_adapter, 
-    detect_task_type
-)
+# GPT-Researcher / DeepAnalyze 适配器（依赖 websockets、openai 等较重的包）在首次使用时再导入，见 get_*_adapter
 
-# 导入 DeepAnalyze 适配器
-from backend_api.deepanalyze_adapter import get_deepanalyze_adapter
+from backend_api import semantic_cache
+from backend_api.http_cache import apply_weak_etag
+from backend_api.supabase_client import get_supabase
 from backend_api.rag.rag_search import run_semantic_retrieval
-from backend_api.rag.rag_context import build_messages_with_evidence, build_evidence_block
+from backend_api.rag.rag_context import EVIDENCE_HEADER, format_evidence_item
 from backend_api.web_search import (
     search_web,
-    build_web_evidence_block,
+    format_web_evidence_item,
 )
 
 # ===== 配置 =====
@@ -70,9 +85,70 @@ WEB_SEARCH_KEYWORDS = [
     "公告",
     "行业",
 ]
+# 关键词预编译为单个正则，一次扫描即可判断是否命中任一关键词
+_RAG_KEYWORDS_RE = re.compile("|".join(map(re.escape, RAG_KEYWORDS)))
+_WEB_SEARCH_KEYWORDS_RE = re.compile("|".join(map(re.escape, WEB_SEARCH_KEYWORDS)))
 
 agent_chat_bp = Blueprint("agent_chat", __name__)
-_supabase = supabase
+logger = logging.getLogger(__name__)
+
+# Supabase 客户端在首次访问数据库时才创建（见 backend_api.supabase_client），首次拿到时调整连接池
+_supabase_tuned = False
+_supabase_lock = threading.Lock()
+
+
+def _get_supabase():
+    """返回共享的 Supabase 客户端；首次拿到时调整 PostgREST 连接池（双重检查加锁），不可用时返回 None"""
+    global _supabase_tuned
+    client = get_supabase()
+    if client is None or _supabase_tuned:
+        return client
+    with _supabase_lock:
+        if not _supabase_tuned:
+            _tune_postgrest_transport(client)
+            _supabase_tuned = True
+    return client
+
+
+def _tune_postgrest_transport(client) -> None:
+    """
+    放大 PostgREST（httpx）客户端的 keep-alive 连接池，并对建连失败重试；
+    安装了 h2 时启用 HTTP/2。持久化线程池与 I/O 线程池并发写库时不再排队等连接。
+    依赖 supabase-py 内部属性，版本不兼容时保持默认配置。
+    """
+    if client is None or httpx is None:
+        return
+    limits = httpx.Limits(
+        max_keepalive_connections=_get_env_int("SUPABASE_POOL_KEEPALIVE", 32),
+        max_connections=_get_env_int("SUPABASE_POOL_MAXSIZE", 64),
+    )
+    try:
+        session = client.postgrest.session
+        try:
+            transport = httpx.HTTPTransport(retries=2, limits=limits, http2=True)
+        except ImportError:  # 未安装 h2
+            transport = httpx.HTTPTransport(retries=2, limits=limits)
+        old_transport = getattr(session, "_transport", None)
+        if not isinstance(old_transport, httpx.HTTPTransport):
+            return
+        session._transport = transport
+        old_transport.close()
+    except Exception as e:
+        logger.warning("⚠️ 调整 Supabase 连接池失败，使用默认配置: %s", e)
+
+
+# 连接池中的 keep-alive 连接可能已被服务端（或中间代理）关闭，复用时报 RemoteProtocolError；
+# 此时请求尚未被处理，换一条连接重发一次即可
+_STALE_CONNECTION_ERRORS = (httpx.RemoteProtocolError,) if httpx is not None else ()
+
+
+def _execute(query):
+    """执行 Supabase 查询；遇到失效的 keep-alive 连接时重试一次"""
+    try:
+        return query.execute()
+    except _STALE_CONNECTION_ERRORS as e:
+        logger.warning("⚠️ Supabase 连接已失效，重试一次: %s", e)
+        return query.execute()
 
 
 def _get_env_int(name: str, default: int) -> int:
@@ -93,21 +169,375 @@ USE_WEB_SEARCH = os.getenv("USE_WEB_SEARCH", "true").lower() == "true"
 WEB_SEARCH_TOPK = _get_env_int("WEB_SEARCH_TOPK", 6)
 WEB_SEARCH_CACHE_MINUTES = _get_env_int("WEB_SEARCH_CACHE_MINUTES", 30)
 WEB_SEARCH_MIN_SCORE = _get_env_float("WEB_SEARCH_MIN_SCORE", 0.0)
+# 重复提交判定窗口（秒）：同一会话在收到回复后该时间内再次发送相同消息，直接返回上次回复；0 表示关闭
+CHAT_DEDUPE_WINDOW_SECONDS = _get_env_int("CHAT_DEDUPE_WINDOW_SECONDS", 10)
+# 服务端保留的最大对话轮数（每轮 user + assistant 两条），超出部分丢弃最早的消息
+MAX_HISTORY_TURNS = _get_env_int("MAX_HISTORY_TURNS", 20)
+# 历史消息总字符数上限（近似 token 预算）：从最新一条往前累计，超出后更早的消息全部丢弃；0 表示不限制
+MAX_HISTORY_CHARS = _get_env_int("MAX_HISTORY_CHARS", 12000)
+_HISTORY_ROLES = frozenset(("user", "assistant", "system"))
+# 单条用户消息的最大字符数，超出直接返回 400
+CHAT_MAX_MESSAGE_CHARS = _get_env_int("CHAT_MAX_MESSAGE_CHARS", 20000)
 
+# 上游 I/O 线程池：RAG 检索与联网搜索互不依赖，并发发起
+_IO_POOL = ThreadPoolExecutor(
+    max_workers=_get_env_int("CHAT_IO_WORKERS", 16),
+    thread_name_prefix="agent-chat-io",
+)
+# 聊天记录持久化线程池：写库不阻塞响应，进程退出前等待剩余写入完成（见 _flush_persistence）
+_PERSIST_POOL = ThreadPoolExecutor(
+    max_workers=_get_env_int("CHAT_PERSIST_WORKERS", 8),
+    thread_name_prefix="supabase-persist",
+)
+# 持久化合并缓冲：请求只把本轮消息追加到缓冲区，后台线程收到第一条后再等待 CHAT_PERSIST_FLUSH_MS 毫秒
+# （或攒满 CHAT_PERSIST_BATCH_ROWS 行），把期间所有会话的消息合并为一次写库。
+# 消息在提交到线程池前一直留在缓冲区中，进程退出时 _flush_persistence 不会漏掉正在攒批的消息
+CHAT_PERSIST_FLUSH_MS = _get_env_int("CHAT_PERSIST_FLUSH_MS", 50)
+CHAT_PERSIST_BATCH_ROWS = _get_env_int("CHAT_PERSIST_BATCH_ROWS", 500)
+_persist_buffer: List[Dict[str, Any]] = []
+_persist_cond = threading.Condition()
+_persist_worker_started = False
+_persist_worker_lock = threading.Lock()
+# 批量持久化函数（见 chat_tables.sql）；置空则直接使用 upsert + insert
+CHAT_PERSIST_RPC = os.getenv("CHAT_PERSIST_RPC", "chat_persist_turns").strip()
+_persist_rpc_available = bool(CHAT_PERSIST_RPC)
+# 聊天历史缓存（可选）：配置 REDIS_URL 后按 session_id 缓存 /chat/history 的查询结果，写入新消息时失效
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+CHAT_HISTORY_CACHE_TTL = _get_env_int("CHAT_HISTORY_CACHE_TTL", 300)
+_redis = (
+    redis.Redis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    if redis is not None and REDIS_URL
+    else None
+)
+# 逐 chunk 调试日志（logger.debug）只在调试模式（FLASK_DEBUG=1 或 LOG_LEVEL=DEBUG）下生成，避免每个 token 都做一次日志级别判断
+DEBUG_STREAM_LOG = os.getenv("FLASK_DEBUG") == "1" or os.getenv("LOG_LEVEL", "").upper() == "DEBUG"
+# SSE 心跳间隔（秒）：上游长时间无输出时发送注释帧，防止代理（nginx / CDN）空闲超时断开连接
+SSE_HEARTBEAT_SECONDS = _get_env_float("SSE_HEARTBEAT_SECONDS", 10.0)
+# 流式输出合并：上游逐字输出时，攒够 SSE_COALESCE_MAX_CHARS 个字符或首个片段等待超过 SSE_COALESCE_MS 毫秒即合并为一帧发送；0 表示不合并
+SSE_COALESCE_MS = _get_env_int("SSE_COALESCE_MS", 20)
+SSE_COALESCE_MAX_CHARS = _get_env_int("SSE_COALESCE_MAX_CHARS", 64)
+
+
+# (整秒时间戳, 对应的 ISO 字符串)；整体替换元组，多线程读到的两项总是一致
+_now_iso_cache: Tuple[int, str] = (0, "")
+# 最近一次分配的消息时间（微秒），见 _message_created_at
+_last_message_us = 0
+_message_ts_lock = threading.Lock()
 
-def _to_iso(dt: Optional[datetime]) -> str:
-    """将datetime转换为ISO8601格式"""
-    if dt is None:
-        dt = datetime.now(timezone.utc)
-    if dt.tzinfo is None:
-        dt = dt.replace(tzinfo=timezone.utc)
-    return dt.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+def _now_iso() -> str:
+    """当前 UTC 时间的 ISO8601 字符串（秒级精度，形如 2024-01-01T00:00:00Z）；同一秒内复用已格式化的字符串"""
+    global _now_iso_cache
+    now = int(time.time())
+    cached = _now_iso_cache
+    if cached[0] != now:
+        cached = (now, datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"))
+        _now_iso_cache = cached
+    return cached[1]
+
+
+def _message_created_at() -> str:
+    """
+    消息写入时间：微秒精度的 ISO8601 字符串，本进程内严格递增。
+    同一轮的用户消息与回复在同一进程内先后生成，即使回复来自缓存、与用户消息落在同一微秒，
+    按 created_at 排序时用户消息也一定在前（_now_iso 只有秒级精度，不能用于消息排序）。
+    """
+    global _last_message_us
+    with _message_ts_lock:
+        now_us = max(time.time_ns() // 1000, _last_message_us + 1)
+        _last_message_us = now_us
+    seconds, micros = divmod(now_us, 1_000_000)
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=micros).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
 
-def _contains_keyword(text: str, keywords: List[str]) -> bool:
+def _contains_keyword(text: str, pattern: "re.Pattern[str]") -> bool:
     if not text:
         return False
-    return any(keyword in text for keyword in keywords)
+    return pattern.search(text) is not None
+
+
+def _sse(payload: Dict[str, Any]) -> bytes:
+    """将事件编码为一帧 SSE（orjson 直接输出 UTF-8 bytes，中文不转义）"""
+    return b"data: " + orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+# chunk 帧（每个 token 一帧）只编码增量文本，前后缀字节预先拼好，不再为每个 token 构造 dict
+_CHUNK_PREFIX = b'data: {"type":"chunk","content":'
+_CHUNK_SUFFIX = b"}\n\n"
+
+
+def _sse_chunk(content: str) -> bytes:
+    return _CHUNK_PREFIX + orjson.dumps(content) + _CHUNK_SUFFIX
+
+
+# 内容固定的帧在导入时编码一次
+_EMPTY_EVIDENCE_FRAME = _sse({"type": "evidence", "items": []})
+# 注释帧（以 ":" 开头）会被 EventSource 忽略，不影响前端事件处理
+_SSE_OPEN_FRAME = b":ok\n\n"
+_SSE_HEARTBEAT_FRAME = b": keep-alive\n\n"
+# _with_heartbeat 在空闲超时时产出的占位对象
+_IDLE = object()
+_STREAM_END = object()
+
+
+def _drain_in_background(items: Iterator[Any]) -> Tuple["queue.Queue[Any]", threading.Event]:
+    """由后台线程消费 items 并放入队列，结束时放入 _STREAM_END，异常对象原样入队；设置返回的 Event 后在下一条数据处停止"""
+    buffer: "queue.Queue[Any]" = queue.Queue()
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in items:
+                if stopped.is_set():
+                    break
+                buffer.put(item)
+        except Exception as exc:
+            buffer.put(exc)
+        finally:
+            buffer.put(_STREAM_END)
+
+    threading.Thread(target=produce, name="sse-producer", daemon=True).start()
+    return buffer, stopped
+
+
+def _with_heartbeat(items: Iterator[Any], interval: float = SSE_HEARTBEAT_SECONDS) -> Iterator[Any]:
+    """
+    由后台线程消费 items 并放入队列；超过 interval 秒没有新数据时产出 _IDLE，
+    调用方据此发送心跳帧。上游异常原样抛给调用方；调用方提前退出时生产线程在下一条数据后停止。
+    """
+    buffer, stopped = _drain_in_background(items)
+    try:
+        while True:
+            try:
+                item = buffer.get(timeout=interval)
+            except queue.Empty:
+                yield _IDLE
+                continue
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def _coalesce_text(
+    pieces: Iterator[str],
+    max_delay: float = SSE_COALESCE_MS / 1000,
+    max_chars: int = SSE_COALESCE_MAX_CHARS,
+    interval: float = SSE_HEARTBEAT_SECONDS,
+) -> Iterator[Any]:
+    """
+    合并上游的短文本片段：累计达到 max_chars 个字符，或距首个未发送片段超过 max_delay 秒时，拼接为一段产出；
+    空闲超过 interval 秒时产出 _IDLE（同 _with_heartbeat）。流结束或上游异常前先产出剩余内容。
+    """
+    buffer, stopped = _drain_in_background(pieces)
+    pending: List[str] = []
+    pending_chars = 0
+    deadline: Optional[float] = None
+    try:
+        while True:
+            timeout = interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = buffer.get(timeout=timeout)
+            except queue.Empty:
+                if pending:
+                    yield "".join(pending)
+                    pending.clear()
+                    pending_chars, deadline = 0, None
+                else:
+                    yield _IDLE
+                continue
+            if item is _STREAM_END or isinstance(item, Exception):
+                if pending:
+                    yield "".join(pending)
+                if item is _STREAM_END:
+                    return
+                raise item
+            pending.append(item)
+            pending_chars += len(item)
+            if deadline is None:
+                deadline = time.monotonic() + max_delay
+            if pending_chars >= max_chars or time.monotonic() >= deadline:
+                yield "".join(pending)
+                pending.clear()
+                pending_chars, deadline = 0, None
+    finally:
+        stopped.set()
+
+
+@lru_cache(maxsize=256)
+def _system_message(system_prompt: str) -> Dict[str, str]:
+    """无证据时的系统消息按提示词复用同一个 dict（只读：下游适配器与 LLM 调用不修改 messages 中的 dict）"""
+    return {"role": "system", "content": system_prompt}
+
+
+def _get_system_prompt(temporary_prompts: Any) -> str:
+    """按临时提示词组合缓存系统提示词；最常见的无临时提示词情况只是一次字典查找"""
+    if not isinstance(temporary_prompts, list):
+        return build_system_prompt_cached()
+    return build_system_prompt_cached(tuple(p for p in temporary_prompts if isinstance(p, str)))
+
+
+def _parse_sse_data(data: bytes, quiet: bool = False) -> Any:
+    """解析 data 字段内容：返回 _STREAM_END 表示 [DONE]，None 表示无数据或不是完整 JSON（quiet 时不记录警告）"""
+    if not data:
+        return None
+    # 检查结束标记
+    if data == b"[DONE]":
+        return _STREAM_END
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError as e:
+        # 如果不是JSON格式，可能是纯文本，跳过
+        if not quiet:
+            logger.warning("⚠️ 解析流式数据失败: %s, 行内容: %s", e, data[:100].decode('utf-8', 'replace'))
+        return None
+
+
+def _iter_sse_lines(response) -> Iterator[bytes]:
+    """
+    按块读取上游流并切分为行，\r\n 与单独的 \r 统一视为换行。
+    块末尾的 \r 暂不处理、拼到下一块开头，避免 \r\n 恰好被拆在两块之间时多出一个空行。
+    """
+    buf = bytearray()
+    pending_cr = False
+    for chunk in response.iter_content(chunk_size=8192):
+        if not chunk:
+            continue
+        if pending_cr:
+            chunk = b"\r" + chunk
+        pending_cr = chunk.endswith(b"\r")
+        if pending_cr:
+            chunk = chunk[:-1]
+        buf += chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(buf[start:end])
+            start = end + 1
+        # 未结束的半行留在缓冲区，等待下一块数据
+        del buf[:start]
+    if pending_cr:
+        buf += b"\n"
+    if buf:
+        yield bytes(buf)
+
+
+def _iter_sse_payloads(response) -> Iterator[Any]:
+    """
+    逐行解析上游 SSE 流，产出 orjson 解析后的数据，遇到 [DONE] 结束。
+    每读到一行 data 就尝试解析，已是完整 JSON 时立即产出，不依赖空行分帧，
+    上游只用单个换行分隔事件时也能逐条解析；跨多行的 data 继续拼接，直到解析成功或遇到空行。
+    """
+    data = bytearray()
+    for line in _iter_sse_lines(response):
+        line = line.strip()
+        if not line:
+            # 空行结束一帧：仍未解析成功的残留数据按原样解析一次（失败时记录警告）
+            if data:
+                payload = _parse_sse_data(bytes(data))
+                data.clear()
+                if payload is _STREAM_END:
+                    return
+                if payload is not None:
+                    yield payload
+            continue
+        # 跳过注释行
+        if line.startswith(b":"):
+            continue
+        # 移除 "data:" 前缀（如果存在）
+        if line.startswith(b"data:"):
+            line = line[5:].lstrip()
+        if data:
+            data += b"\n"
+        data += line
+        payload = _parse_sse_data(bytes(data), quiet=True)
+        if payload is None:
+            continue
+        data.clear()
+        if payload is _STREAM_END:
+            return
+        yield payload
+    # 上游未以空行结尾时，处理最后一帧
+    payload = _parse_sse_data(bytes(data))
+    if payload is not None and payload is not _STREAM_END:
+        yield payload
+
+
+def _extract_stream_content(chunk_data: Dict[str, Any]) -> str:
+    """从一帧流式数据中提取增量文本，兼容 OpenAI / DashScope / 纯文本格式"""
+    # OpenAI兼容格式
+    if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
+        delta = chunk_data["choices"][0].get("delta", {})
+        return delta.get("content", "")
+    
+    # DashScope格式（Qwen可能使用）
+    if "output" in chunk_data:
+        output = chunk_data["output"]
+        if "choices" in output and len(output["choices"]) > 0:
+            choice = output["choices"][0]
+            if "delta" in choice:
+                return choice["delta"].get("content", "")
+            if "message" in choice:
+                return choice["message"].get("content", "")
+            if "text" in choice:
+                return choice.get("text", "")
+        elif "text" in output:
+            return output.get("text", "")
+        return ""
+    
+    # 直接文本格式
+    if "text" in chunk_data:
+        return chunk_data.get("text", "")
+    return ""
+
+
+def _extract_openai_content(chunk_data: Dict[str, Any]) -> str:
+    """OpenAI 兼容格式的专用提取：只取 choices[0].delta.content"""
+    choices = chunk_data.get("choices")
+    if not choices:
+        return ""
+    return choices[0].get("delta", {}).get("content", "")
+
+
+def _iter_stream_content(response) -> Iterator[str]:
+    """逐帧解析上游流并产出非空的增量文本；提取函数按首帧格式选定一次"""
+    extract_content = None
+    for chunk_data in _iter_sse_payloads(response):
+        try:
+            if extract_content is None:
+                extract_content = _select_content_extractor(chunk_data)
+            content = extract_content(chunk_data)
+        except Exception as e:
+            logger.warning("⚠️ 处理流式数据出错: %s", e)
+            continue
+        if content:
+            yield content
+
+
+def _select_content_extractor(first_chunk: Any):
+    """
+    按首帧判断上游格式，之后整条流固定使用同一个提取函数：
+    OpenAI 兼容格式走专用路径，其余（DashScope / 纯文本）仍走通用兼容逻辑
+    """
+    if isinstance(first_chunk, dict) and first_chunk.get("choices"):
+        return _extract_openai_content
+    return _extract_stream_content
+
+
+def _resolve_options(overrides: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并默认选项与请求选项；请求未覆盖时直接复用配置中已缓存的默认选项（只读，不修改）"""
+    defaults = get_default_options()
+    if not overrides or not isinstance(overrides, dict):
+        return defaults
+    return {**defaults, **overrides}
+
+
+_SOURCE_GROUPS = {"rag": "database", "web": "internet"}
 
 
 def _build_sources_payload(evidence: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
@@ -115,26 +545,16 @@ def _build_sources_payload(evidence: List[Dict[str, Any]]) -> Dict[str, List[Dic
     seen = {"database": set(), "internet": set()}
 
     for item in evidence or []:
-        if not isinstance(item, dict):
-            continue
-        origin = (item.get("origin") or "").strip().lower()
-        if origin == "rag":
-            group_key = "database"
-        elif origin == "web":
-            group_key = "internet"
-        else:
+        # origin 由 _build_retrieval_messages 写入固定字面量 "rag"/"web"，无需再规范化
+        origin = item.get("origin")
+        group_key = _SOURCE_GROUPS.get(origin)
+        if group_key is None:
             continue
 
         title = str(item.get("title") or "").strip()
         url = str(item.get("url") or "").strip()
         source_name = str(item.get("source") or "").strip()
-        published_at = (
-            item.get("published_at")
-            or item.get("publishedAt")
-            or item.get("published")
-            or item.get("date")
-            or ""
-        )
+        published_at = item.get("published_at") or ""
 
         if not title and not url:
             continue
@@ -163,8 +583,8 @@ def _build_retrieval_messages(
     use_rag: bool,
     use_web_search: bool,
 ) -> Dict[str, object]:
-    rag_triggered = bool(use_rag) or _contains_keyword(user_message, RAG_KEYWORDS)
-    web_triggered = bool(use_web_search) or _contains_keyword(user_message, WEB_SEARCH_KEYWORDS)
+    rag_triggered = bool(use_rag) or _contains_keyword(user_message, _RAG_KEYWORDS_RE)
+    web_triggered = bool(use_web_search) or _contains_keyword(user_message, _WEB_SEARCH_KEYWORDS_RE)
     combined_triggered = rag_triggered or web_triggered
 
     rag_results: List[Dict[str, Any]] = []
@@ -172,31 +592,41 @@ def _build_retrieval_messages(
     used_evidence: List[Dict[str, Any]] = []
 
     if combined_triggered:
-        try:
-            rag_results = run_semantic_retrieval(
+        rag_future = _IO_POOL.submit(
+            run_semantic_retrieval,
+            user_message,
+            k=_get_env_int("RAG_TOPK", 8),
+            min_sim=_get_env_float("RAG_MIN_SIM", 0.4),
+        )
+        web_future = None
+        if USE_WEB_SEARCH:
+            web_future = _IO_POOL.submit(
+                search_web,
                 user_message,
-                k=_get_env_int("RAG_TOPK", 8),
-                min_sim=_get_env_float("RAG_MIN_SIM", 0.4),
+                max_results=WEB_SEARCH_TOPK,
+                min_score=WEB_SEARCH_MIN_SCORE,
+                cache_ttl_seconds=WEB_SEARCH_CACHE_MINUTES * 60,
             )
+        elif web_triggered:
+            logger.warning("⚠️ Web 搜索已触发但未启用 USE_WEB_SEARCH")
+
+        try:
+            rag_results = rag_future.result()
         except Exception as exc:
-            print(f"⚠️ RAG 处理异常，回退到默认聊天: {exc}")
+            logger.warning("⚠️ RAG 处理异常，回退到默认聊天: %s", exc)
 
-        if USE_WEB_SEARCH:
+        if web_future is not None:
             try:
-                web_results = search_web(
-                    user_message,
-                    max_results=WEB_SEARCH_TOPK,
-                    min_score=WEB_SEARCH_MIN_SCORE,
-                    cache_ttl_seconds=WEB_SEARCH_CACHE_MINUTES * 60,
-                )
+                web_results = web_future.result()
             except Exception as exc:
-                print(f"⚠️ Web 搜索失败: {exc}")
-        elif web_triggered:
-            print("⚠️ Web 搜索已触发但未启用 USE_WEB_SEARCH")
+                logger.warning("⚠️ Web 搜索失败: %s", exc)
 
+    # 每个来源只遍历一次：同时生成返回给前端的证据与提示词中的证据文本
+    evidence_blocks: List[str] = []
     if rag_results:
-        used_evidence.extend(
-            [
+        rag_lines = ["【本地知识库】", EVIDENCE_HEADER]
+        for idx, item in enumerate(rag_results, start=1):
+            used_evidence.append(
                 {
                     "id": item.get("id"),
                     "title": item.get("title"),
@@ -207,12 +637,13 @@ def _build_retrieval_messages(
                     "similarity": item.get("similarity"),
                     "origin": "rag",
                 }
-                for item in rag_results
-            ]
-        )
+            )
+            rag_lines.extend(format_evidence_item(idx, item))
+        evidence_blocks.append("\n".join(rag_lines))
     if web_results:
-        used_evidence.extend(
-            [
+        web_lines = ["【网络搜索】"]
+        for idx, item in enumerate(web_results, start=1):
+            used_evidence.append(
                 {
                     "id": None,
                     "title": item.get("title"),
@@ -223,15 +654,9 @@ def _build_retrieval_messages(
                     "similarity": item.get("score"),
                     "origin": "web",
                 }
-                for item in web_results
-            ]
-        )
-
-    evidence_blocks: List[str] = []
-    if rag_results:
-        evidence_blocks.append(f"【本地知识库】\n{build_evidence_block(rag_results)}")
-    if web_results:
-        evidence_blocks.append(build_web_evidence_block(web_results))
+            )
+            web_lines.extend(format_web_evidence_item(idx, item))
+        evidence_blocks.append("\n".join(web_lines))
 
     messages: List[Dict[str, str]] = []
     if evidence_blocks:
@@ -248,16 +673,14 @@ def _build_retrieval_messages(
         messages.append({"role": "user", "content": user_message})
 
         if rag_results:
-            print(f"🔍 RAG 检索已触发，返回 {len(rag_results)} 条证据")
+            logger.info("🔍 RAG 检索已触发，返回 %s 条证据", len(rag_results))
         if web_results:
-            print(f"🌐 Web 搜索已触发，返回 {len(web_results)} 条证据")
+            logger.info("🌐 Web 搜索已触发，返回 %s 条证据", len(web_results))
     else:
         if combined_triggered:
-            print("🔍 检索已触发但无证据，回退到默认提示")
+            logger.info("🔍 检索已触发但无证据，回退到默认提示")
 
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        messages = [_system_message(system_prompt)] if system_prompt else []
         messages.extend(conversation_history)
         messages.append({"role": "user", "content": user_message})
 
@@ -268,6 +691,21 @@ def _build_retrieval_messages(
     }
 
 
+class _MockResponse:
+    """将适配器返回的 dict 包装为 requests.Response 兼容格式"""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+
 def _call_default_llm(messages: List[Dict[str, str]], stream: bool = False, **options):
     """
     调用默认的大语言模型服务
@@ -279,6 +717,43 @@ def _call_default_llm(messages: List[Dict[str, str]], stream: bool = False, **op
     return llm_chat(messages, stream=stream, **options)
 
 
+def get_gpt_researcher_adapter():
+    from backend_api.gpt_researcher_adapter import get_gpt_researcher_adapter as _get_adapter
+    return _get_adapter()
+
+
+def get_deepanalyze_adapter():
+    from backend_api.deepanalyze_adapter import get_deepanalyze_adapter as _get_adapter
+    return _get_adapter()
+
+
+@lru_cache(maxsize=1024)
+def detect_task_type(user_message: str) -> str:
+    """任务类型只取决于消息文本，相同消息（重试、重复提交）直接复用上次的判定结果"""
+    from backend_api.gpt_researcher_adapter import detect_task_type as _detect
+    return _detect(user_message)
+
+
+# 服务名 -> 适配器工厂；不在表中的服务（如 'qwen'）走默认 LLM
+_PROVIDERS = {
+    "gpt-researcher": get_gpt_researcher_adapter,
+    "deepanalyze": get_deepanalyze_adapter,
+}
+
+
+def _resolve_provider(user_message: str, force_provider: Optional[str]) -> Optional[str]:
+    """确定本次调用的服务：显式指定优先，否则按任务类型自动路由"""
+    if force_provider and force_provider != "auto":
+        return force_provider
+    if AUTO_ROUTE_TASKS and (USE_GPT_RESEARCHER or USE_DEEPANALYZE) and user_message:
+        task_type = detect_task_type(user_message)
+        if task_type == "research" and USE_GPT_RESEARCHER:
+            return "gpt-researcher"
+        if task_type == "data" and USE_DEEPANALYZE:
+            return "deepanalyze"
+    return None
+
+
 def _call_llm_api(
     messages: List[Dict[str, str]], 
     user_message: str = "",
@@ -299,233 +774,531 @@ def _call_llm_api(
     Returns:
         响应对象或生成器
     """
-    # 如果强制指定了服务
-    if force_provider == 'gpt-researcher':
-        adapter = get_gpt_researcher_adapter()
-        if stream:
-            return adapter.chat_completions_stream(messages, **options)
-        else:
-            result = adapter.chat_completions(messages, **options)
-            # 转换为 requests.Response 兼容格式
-            class MockResponse:
-                def __init__(self, data):
-                    self._data = data
-                def json(self):
-                    return self._data
-                def raise_for_status(self):
-                    pass
-            return MockResponse(result)
+    provider = _resolve_provider(user_message, force_provider)
+    factory = _PROVIDERS.get(provider)
+    if factory is None:
+        # 默认使用本地 LLM 服务
+        return _call_default_llm(messages, stream=stream, **options)
     
-    if force_provider == 'deepanalyze':
-        adapter = get_deepanalyze_adapter()
-        if stream:
-            return adapter.chat_completions_stream(messages, **options)
-        else:
-            result = adapter.chat_completions(messages, **options)
-            class MockResponse:
-                def __init__(self, data):
-                    self._data = data
-                def json(self):
-                    return self._data
-                def raise_for_status(self):
-                    pass
-            return MockResponse(result)
+    adapter = factory()
+    if stream:
+        return adapter.chat_completions_stream(messages, **options)
+    return _MockResponse(adapter.chat_completions(messages, **options))
+
+
+def _message_row(session_id: str, role: str, content: str, message_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    构造一条待写入的消息记录（created_at 取构造时刻，微秒精度且本进程内严格递增，保证用户消息早于回复）。
+    id 总是在后端生成：不同会话的消息会合并为一次批量 insert，各行字段必须一致。
+    """
+    return {
+        "id": message_id or str(uuid.uuid4()),
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "created_at": _message_created_at(),
+    }
+
+
+def _save_messages(rows: List[Dict[str, Any]]):
+    """批量保存消息到数据库（一次 insert 写入一批消息；returning=minimal，不回传写入的行）"""
+    sb = _get_supabase()
+    if not sb or not rows:
+        return False
     
-    # 自动路由或使用 Qwen
-    if AUTO_ROUTE_TASKS and (USE_GPT_RESEARCHER or USE_DEEPANALYZE) and user_message:
-        task_type = detect_task_type(user_message)
-        if task_type == 'research' and USE_GPT_RESEARCHER:
-            # 研究任务使用 GPT-Researcher
-            adapter = get_gpt_researcher_adapter()
-            if stream:
-                return adapter.chat_completions_stream(messages, **options)
-            else:
-                result = adapter.chat_completions(messages, **options)
-                class MockResponse:
-                    def __init__(self, data):
-                        self._data = data
-                    def json(self):
-                        return self._data
-                    def raise_for_status(self):
-                        pass
-                return MockResponse(result)
-        elif task_type == 'data' and USE_DEEPANALYZE:
-            # 数据分析任务使用 DeepAnalyze
-            adapter = get_deepanalyze_adapter()
-            if stream:
-                return adapter.chat_completions_stream(messages, **options)
-            else:
-                result = adapter.chat_completions(messages, **options)
-                class MockResponse:
-                    def __init__(self, data):
-                        self._data = data
-                    def json(self):
-                        return self._data
-                    def raise_for_status(self):
-                        pass
-                return MockResponse(result)
+    try:
+        _execute(sb.table(CHAT_MESSAGES_TABLE).insert(rows, returning="minimal"))
+        return True
+    except Exception as e:
+        logger.warning("⚠️ 保存消息失败: %s", e)
+        return False
+
+
+def _create_or_update_sessions(session_ids: List[str], title: Optional[str] = None):
+    """创建或更新聊天会话（一次 upsert 写入多个会话，按 id 冲突时更新；returning=minimal，不回传会话行）"""
+    sb = _get_supabase()
+    if not sb or not session_ids:
+        return False
     
-    # 默认使用本地 LLM 服务
-    return _call_default_llm(messages, stream=stream, **options)
+    try:
+        # created_at 不写入：新建时由表默认值 NOW() 填充，已存在时保持不变
+        now_iso = _now_iso()
+        session_rows = [
+            {"id": session_id, "title": title or "新对话", "updated_at": now_iso}
+            for session_id in session_ids
+        ]
+        _execute(sb.table(CHAT_SESSIONS_TABLE).upsert(
+            session_rows, on_conflict="id", returning="minimal"
+        ))
+        return True
+    except Exception as e:
+        logger.warning("⚠️ 创建/更新会话失败: %s", e)
+        return False
 
 
-def _save_message(session_id: str, role: str, content: str, message_id: Optional[str] = None):
-    """保存消息到数据库"""
-    if not _supabase:
-        return None
+def _is_missing_function_error(exc: Exception) -> bool:
+    # PostgREST 找不到函数时返回 PGRST202；直连 Postgres 报错时为 42883（undefined_function）
+    return getattr(exc, "code", None) in ("PGRST202", "42883")
+
+
+def _write_rows(sb, rows: List[Dict[str, Any]], session_ids: List[str]) -> bool:
+    """
+    一次写入给定消息：RPC（chat_tables.sql 中的 chat_persist_turns）在同一事务内完成会话 upsert
+    与消息写入。数据库未部署该函数时回退为会话 upsert + 批量 insert 两次请求，并在本进程内不再尝试 RPC。
+    """
+    global _persist_rpc_available
+    if _persist_rpc_available:
+        try:
+            _execute(sb.rpc(CHAT_PERSIST_RPC, {"p_messages": rows}))
+            return True
+        except Exception as e:
+            if not _is_missing_function_error(e):
+                logger.warning("⚠️ 保存对话失败: %s", e)
+                return False
+            _persist_rpc_available = False
+            logger.warning("⚠️ 数据库未部署 %s，回退为 upsert + insert", CHAT_PERSIST_RPC)
+    _create_or_update_sessions(session_ids)
+    return _save_messages(rows)
+
+
+def _persist_rows(rows: List[Dict[str, Any]]) -> bool:
+    """
+    写入一批消息（可跨多个会话），正常情况下整批只发一次请求。
+    整批失败时（如其中某个会话的数据异常）按会话拆开重试，只丢失出错会话的消息。
+    """
+    sb = _get_supabase()
+    if not sb or not rows:
+        return False
+    
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(row["session_id"], []).append(row)
+    
+    if _write_rows(sb, rows, list(groups)):
+        saved_ids = list(groups)
+    elif len(groups) > 1:
+        logger.warning("⚠️ 合并写入 %d 个会话失败，按会话拆分重试", len(groups))
+        saved_ids = [
+            session_id for session_id, group in groups.items()
+            if _write_rows(sb, group, [session_id])
+        ]
+    else:
+        saved_ids = []
+    for session_id in saved_ids:
+        _invalidate_history_cache(session_id)
+    return len(saved_ids) == len(groups)
+
+
+def _persist_worker() -> None:
+    """
+    合并写库线程：缓冲区出现第一批消息后继续收集 CHAT_PERSIST_FLUSH_MS 毫秒，整批提交到持久化线程池。
+    取出与提交都在锁内完成，_flush_persistence 要么取到这批消息，要么等到它在线程池中写完。
+    """
+    while True:
+        with _persist_cond:
+            while not _persist_buffer:
+                _persist_cond.wait()
+            deadline = time.monotonic() + CHAT_PERSIST_FLUSH_MS / 1000
+            while _persist_buffer and len(_persist_buffer) < CHAT_PERSIST_BATCH_ROWS:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                _persist_cond.wait(timeout)
+            batch = list(_persist_buffer)
+            _persist_buffer.clear()
+            if not batch:  # 等待期间已被 _flush_persistence 取走
+                continue
+            try:
+                _PERSIST_POOL.submit(_persist_rows, batch)
+                continue
+            except RuntimeError:  # 解释器退出中，线程池已关闭
+                pass
+        _persist_rows(batch)
+
+
+def _persist_turn_async(rows: List[Dict[str, Any]]) -> None:
+    """后台持久化一轮对话：只追加到合并缓冲区，请求线程不等待写库结果"""
+    global _persist_worker_started
+    if not _persist_worker_started:
+        # 首次使用时才启动合并线程（gunicorn --preload 时 master 中启动的线程不会带到 worker 进程）
+        with _persist_worker_lock:
+            if not _persist_worker_started:
+                threading.Thread(target=_persist_worker, name="supabase-persist-batcher", daemon=True).start()
+                _persist_worker_started = True
+    with _persist_cond:
+        _persist_buffer.extend(rows)
+        _persist_cond.notify()
+
+
+def _flush_persistence() -> None:
+    """进程退出时写入缓冲区中尚未提交的消息（含合并线程正在攒的批次），并等待进行中的写库完成"""
+    with _persist_cond:
+        rows = list(_persist_buffer)
+        _persist_buffer.clear()
+    if rows:
+        _persist_rows(rows)
+    _PERSIST_POOL.shutdown(wait=True)
+
+
+atexit.register(_flush_persistence)
+
+
+def _history_cache_key(session_id: str) -> str:
+    # 同一会话的不同 limit 存在同一个 hash 的不同字段中，失效时删除一个 key 即可
+    return f"chat:hist:{session_id}"
+
+
+def _invalidate_history_cache(session_id: str) -> None:
+    if _redis is None:
+        return
+    try:
+        _redis.delete(_history_cache_key(session_id))
+    except redis.RedisError as e:
+        logger.warning("⚠️ 清除历史缓存失败: %s", e)
+
+
+def _get_chat_history(session_id: str, limit: int = 50, after: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    获取聊天历史记录，行格式即前端所需的 {role, content, time}（created_at 由 PostgREST 重命名为 time）。
+    after 不为空时只返回该时间之后的消息（增量拉取，不走缓存）。
+    配置 Redis 时优先读缓存，Redis 不可用时直接查询 Supabase。
+    """
+    sb = _get_supabase()
+    if not sb:
+        return []
+    
+    if after:
+        try:
+            result = _execute(
+                sb.table(CHAT_MESSAGES_TABLE)
+                .select("role,content,time:created_at")
+                .eq("session_id", session_id)
+                .gt("created_at", after)
+                .order("created_at", desc=False)
+                .limit(limit)
+            )
+            return result.data or []
+        except Exception as e:
+            logger.warning("⚠️ 获取聊天历史失败: %s", e)
+            return []
+    
+    cache_key = _history_cache_key(session_id)
+    if _redis is not None:
+        try:
+            cached = _redis.hget(cache_key, limit)
+            if cached is not None:
+                return orjson.loads(cached)
+        except redis.RedisError as e:
+            logger.warning("⚠️ 读取历史缓存失败: %s", e)
     
     try:
-        message_data = {
-            "session_id": session_id,
-            "role": role,
-            "content": content,
-            "created_at": _to_iso(datetime.now(timezone.utc)),
-        }
-        
-        if message_id:
-            message_data["id"] = message_id
-        
-        result = _supabase.table(CHAT_MESSAGES_TABLE).insert(message_data).execute()
-        return result.data[0] if result.data else None
+        result = _execute(
+            sb.table(CHAT_MESSAGES_TABLE)
+            .select("role,content,time:created_at")
+            .eq("session_id", session_id)
+            .order("created_at", desc=False)
+            .limit(limit)
+        )
+        rows = result.data or []
     except Exception as e:
-        print(f"⚠️ 保存消息失败: {e}")
-        return None
+        logger.warning("⚠️ 获取聊天历史失败: %s", e)
+        return []
+    
+    if _redis is not None:
+        try:
+            pipe = _redis.pipeline()
+            pipe.hset(cache_key, limit, orjson.dumps(rows))
+            pipe.expire(cache_key, CHAT_HISTORY_CACHE_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("⚠️ 写入历史缓存失败: %s", e)
+    return rows
 
 
-def _create_or_update_session(session_id: str, title: Optional[str] = None):
-    """创建或更新聊天会话"""
-    if not _supabase:
+def _find_duplicate_reply(session_id: Optional[str], user_message: str) -> Optional[str]:
+    """
+    重复提交检测：会话最近两条消息为「相同的用户消息 + AI回复」，
+    且回复写入时间在 CHAT_DEDUPE_WINDOW_SECONDS 内时，返回该回复内容。
+    """
+    sb = _get_supabase()
+    if not sb or not session_id or CHAT_DEDUPE_WINDOW_SECONDS <= 0:
         return None
     
     try:
-        now = _to_iso(datetime.now(timezone.utc))
-        session_data = {
-            "id": session_id,
-            "title": title or "新对话",
-            "updated_at": now,
-        }
-        
-        # 先查询会话是否存在
-        existing = _supabase.table(CHAT_SESSIONS_TABLE).select("id").eq("id", session_id).execute()
-        
-        if existing.data and len(existing.data) > 0:
-            # 会话存在，更新
-            result = _supabase.table(CHAT_SESSIONS_TABLE).update(session_data).eq("id", session_id).execute()
-            return result.data[0] if result.data else None
-        else:
-            # 会话不存在，插入新会话
-            session_data["created_at"] = now
-            result = _supabase.table(CHAT_SESSIONS_TABLE).insert(session_data).execute()
-            return result.data[0] if result.data else None
+        result = _execute(
+            sb.table(CHAT_MESSAGES_TABLE)
+            .select("role,content,created_at")
+            .eq("session_id", session_id)
+            .order("created_at", desc=True)
+            .limit(2)
+        )
+        rows = result.data or []
+        if len(rows) < 2:
+            return None
+        reply, question = rows[0], rows[1]
+        if reply.get("role") != "assistant" or question.get("role") != "user":
+            return None
+        if question.get("content") != user_message:
+            return None
+        replied_at = datetime.fromisoformat(str(reply.get("created_at")))
+        if replied_at.tzinfo is None:
+            replied_at = replied_at.replace(tzinfo=timezone.utc)
+        if (datetime.now(timezone.utc) - replied_at).total_seconds() > CHAT_DEDUPE_WINDOW_SECONDS:
+            return None
+        return reply.get("content") or None
     except Exception as e:
-        print(f"⚠️ 创建/更新会话失败: {e}")
+        logger.warning("⚠️ 重复提交检测失败: %s", e)
         return None
 
 
-def _get_chat_history(session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-    """获取聊天历史记录"""
-    if not _supabase:
+def _start_duplicate_check(session_id: Optional[str], user_message: str) -> Optional[Future]:
+    """在 I/O 线程池中发起重复提交检测，与检索并发执行；未开启或没有会话ID时返回 None"""
+    if not session_id or CHAT_DEDUPE_WINDOW_SECONDS <= 0:
+        return None
+    return _IO_POOL.submit(_find_duplicate_reply, session_id, user_message)
+
+
+def _normalize_history(raw: Any) -> Optional[List[Dict[str, str]]]:
+    """截断到最近 MAX_HISTORY_TURNS 轮并校验每条消息；格式不合法返回 None"""
+    if raw is None:
+        return []
+    if not isinstance(raw, list):
+        return None
+    if MAX_HISTORY_TURNS <= 0:
+        # raw[-0:] 会保留全部历史，关闭历史时直接返回空列表
         return []
+    history: List[Dict[str, str]] = []
+    for item in raw[-MAX_HISTORY_TURNS * 2:]:
+        if not isinstance(item, dict):
+            return None
+        role, content = item.get("role"), item.get("content")
+        if role not in _HISTORY_ROLES or not isinstance(content, str):
+            return None
+        history.append({"role": role, "content": content})
+    return history
+
+
+def _parse_chat_request(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    一次性校验并规范化聊天请求的标量字段，两个聊天接口共用；
+    不合法时抛出 ValueError，异常信息直接作为 400 响应的 message 返回。
+    conversation_history 由 _resolve_history 单独处理（可能需要查库）。
+    """
+    message = data.get("message") or ""
+    if not isinstance(message, str):
+        raise ValueError("message 必须是字符串")
+    message = message.strip()
+    if not message:
+        raise ValueError("消息内容不能为空")
+    if len(message) > CHAT_MAX_MESSAGE_CHARS:
+        raise ValueError(f"消息内容过长（最多 {CHAT_MAX_MESSAGE_CHARS} 字符）")
+    
+    session_id = data.get("session_id") or None
+    if session_id is not None:
+        if not isinstance(session_id, str):
+            raise ValueError("session_id 必须是字符串")
+        # 会话/消息表的 id 为 uuid 列：非法值会让整批合并写库失败，入口处直接拒绝
+        try:
+            session_id = str(uuid.UUID(session_id))
+        except ValueError:
+            raise ValueError("session_id 必须是合法的 UUID")
     
+    task_type = data.get("task_type") or "auto"
+    return {
+        "message": message,
+        "session_id": session_id,  # 前端传入的会话ID，未传时为 None
+        "temporary_prompts": data.get("temporary_prompts"),  # 前端可以传递临时提示词
+        "options": data.get("options"),
+        "use_rag": bool(data.get("use_rag", False)),
+        "use_web_search": bool(data.get("use_web_search", False)),
+        # 任务类型：'research' 强制使用 GPT-Researcher, 'data' 使用 DeepAnalyze, 'chat' 使用 Qwen, 'auto' 自动路由
+        "task_type": task_type if isinstance(task_type, str) else "auto",
+    }
+
+
+def _load_recent_history(session_id: str) -> List[Dict[str, str]]:
+    """从 Supabase 读取会话最近 MAX_HISTORY_TURNS 轮消息（按时间正序），供前端未携带历史时使用"""
+    sb = _get_supabase()
+    if not sb or MAX_HISTORY_TURNS <= 0:
+        return []
     try:
-        result = (
-            _supabase.table(CHAT_MESSAGES_TABLE)
-            .select("*")
+        result = _execute(
+            sb.table(CHAT_MESSAGES_TABLE)
+            .select("role,content")
             .eq("session_id", session_id)
-            .order("created_at", desc=False)
-            .limit(limit)
-            .execute()
+            .order("created_at", desc=True)
+            .limit(MAX_HISTORY_TURNS * 2)
         )
-        return result.data or []
+        rows = result.data or []
     except Exception as e:
-        print(f"⚠️ 获取聊天历史失败: {e}")
+        logger.warning("⚠️ 读取会话历史失败: %s", e)
         return []
+    rows.reverse()
+    return rows
+
+
+def _resolve_history(data: Dict[str, Any]) -> Optional[List[Dict[str, str]]]:
+    """
+    确定本轮使用的对话历史：请求携带 conversation_history 时校验并截断；
+    未携带但指定了已有 session_id 时以数据库中的记录为准，前端无需回传整段历史。
+    """
+    raw = data.get("conversation_history")
+    if raw is None and data.get("session_id"):
+        history = _load_recent_history(data["session_id"])
+    else:
+        history = _normalize_history(raw)
+    if history is None:
+        return None
+    return _trim_history_chars(history, MAX_HISTORY_CHARS)
+
+
+def _trim_history_chars(history: List[Dict[str, str]], max_chars: int) -> List[Dict[str, str]]:
+    """保留总字符数不超过 max_chars 的最近若干条消息（按时间正序返回）"""
+    if max_chars <= 0:
+        return history
+    total = 0
+    for idx in range(len(history) - 1, -1, -1):
+        total += len(history[idx].get("content") or "")
+        if total > max_chars:
+            return history[idx + 1:]
+    return history
+
+
+def _append_turn(history: List[Dict[str, str]], user_message: str, ai_content: str) -> List[Dict[str, str]]:
+    """就地追加本轮问答（history 为 _normalize_history 生成的请求内副本，可直接修改）"""
+    history.append({"role": "user", "content": user_message})
+    history.append({"role": "assistant", "content": ai_content})
+    return history
+
+
+def _get_json() -> Dict[str, Any]:
+    """用 orjson 直接解析请求体（不经 Flask 的 Content-Type 判断，也不缓存原始 body）"""
+    data = orjson.loads(request.get_data(cache=False) or b"{}")
+    if not isinstance(data, dict):
+        raise ValueError("request body must be a JSON object")
+    return data
+
+
+def _json_response(payload: Dict[str, Any]) -> Response:
+    """成功响应直接用 orjson 编码为 bytes，不经过 jsonify / JSON Provider 的 str 往返"""
+    return Response(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS), mimetype="application/json")
+
+
+def _sse_response(events) -> Any:
+    response = make_response(stream_with_context(events))
+    response.headers["Content-Type"] = "text/event-stream; charset=utf-8"
+    response.headers["Cache-Control"] = "no-cache, no-transform"
+    response.headers["Pragma"] = "no-cache"
+    response.headers["Connection"] = "keep-alive"
+    response.headers["Keep-Alive"] = "timeout=120"
+    response.headers["X-Accel-Buffering"] = "no"  # 禁用Nginx缓冲
+    return response
 
 
 @agent_chat_bp.route("/chat", methods=["POST"])
 def chat():
     """普通聊天接口（非流式）"""
     try:
-        data = request.get_json()
-        user_message = data.get("message", "").strip()
-        session_id = data.get("session_id") or str(uuid.uuid4())
+        try:
+            data = _get_json()
+        except ValueError:
+            return jsonify({"code": 400, "message": "请求体必须是合法的 JSON 对象", "data": None}), 400
+        try:
+            req = _parse_chat_request(data)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": str(e), "data": None}), 400
+        user_message = req["message"]
+        session_id = req["session_id"] or str(uuid.uuid4())
         
         # 从配置文件获取系统提示词（不再从前端传递）
-        temporary_prompts = data.get("temporary_prompts", [])  # 前端可以传递临时提示词
-        system_prompt = build_system_prompt(temporary_prompts=temporary_prompts)
-        
-        conversation_history = data.get("conversation_history", [])
-        options = data.get("options", {})
+        system_prompt = _get_system_prompt(req["temporary_prompts"])
         
-        # 合并默认选项
-        default_options = get_default_options()
-        options = {**default_options, **options}
+        conversation_history = _resolve_history(data)
+        if conversation_history is None:
+            return jsonify({"code": 400, "message": "conversation_history 格式不正确", "data": None}), 400
+        options = _resolve_options(req["options"])
         
-        if not user_message:
-            return jsonify({"code": 400, "message": "消息内容不能为空", "data": None}), 400
+        # 重复提交检测查库与检索并发进行，检索完成后、调用 LLM 前取结果
+        duplicate_future = _start_duplicate_check(req["session_id"], user_message)
         
         # 构建消息列表（本地 RAG + 联网搜索）
-        use_rag = data.get("use_rag", False)
-        use_web_search = data.get("use_web_search", False)
         retrieval = _build_retrieval_messages(
             user_message=user_message,
             system_prompt=system_prompt,
             conversation_history=conversation_history,
-            use_rag=use_rag,
-            use_web_search=use_web_search,
+            use_rag=req["use_rag"],
+            use_web_search=req["use_web_search"],
         )
+        
+        # 重复提交：直接返回上一次的回复，不再调用 LLM
+        duplicate_reply = duplicate_future.result() if duplicate_future else None
+        if duplicate_reply is not None:
+            response = _json_response({
+                "code": 200,
+                "message": "success",
+                "data": {
+                    "session_id": session_id,
+                    "content": duplicate_reply,
+                    "evidence": [],
+                    "sources": {"database": [], "internet": []},
+                    "conversation_history": _append_turn(conversation_history, user_message, duplicate_reply)
+                }
+            })
+            response.headers["X-Cache"] = "HIT"
+            return response
+        
         messages = retrieval["messages"]
         used_evidence = retrieval["used_evidence"]
         sources_payload = retrieval["sources"]
         
-        # 先创建或更新会话（确保会话存在）
-        _create_or_update_session(session_id)
-        
-        # 保存用户消息
-        _save_message(session_id, "user", user_message)
+        # 用户消息与AI回复在本轮结束后连同会话一次写入
+        user_row = _message_row(session_id, "user", user_message)
         
         # 获取任务类型（从前端传递或自动检测）
-        task_type = data.get("task_type", "auto")
+        task_type = req["task_type"]
         
         # 根据 task_type 决定使用哪个服务
         force_provider = None
         if task_type == 'research':
             force_provider = 'gpt-researcher'
-            print(f"🎯 [任务控制] 前端指定使用 GPT-Researcher（研究任务）")
+            logger.info("🎯 [任务控制] 前端指定使用 GPT-Researcher（研究任务）")
         elif task_type == 'data':
             force_provider = 'deepanalyze'
-            print(f"🎯 [任务控制] 前端指定使用 DeepAnalyze（数据分析任务）")
+            logger.info("🎯 [任务控制] 前端指定使用 DeepAnalyze（数据分析任务）")
         elif task_type == 'chat':
             force_provider = 'qwen'
-            print(f"🎯 [任务控制] 前端指定使用 Qwen（聊天任务）")
+            logger.info("🎯 [任务控制] 前端指定使用 Qwen（聊天任务）")
         else:
-            print(f"🎯 [任务控制] 使用自动路由（task_type: {task_type}）")
+            logger.info("🎯 [任务控制] 使用自动路由（task_type: %s）", task_type)
         
-        # 调用 LLM API（根据 task_type 选择服务）
-        response = _call_llm_api(messages, user_message=user_message, stream=False, force_provider=force_provider, **options)
-        result = response.json()
+        # 语义缓存：相近问题 + 相同上下文直接复用回答
+        cache_key = semantic_cache.context_key(messages, task_type=task_type, options=options)
+        ai_content = semantic_cache.lookup(user_message, cache_key) or ""
         
-        # 提取AI回复
-        ai_content = ""
-        if result.get("choices") and len(result["choices"]) > 0:
-            ai_content = result["choices"][0].get("message", {}).get("content", "")
-        elif result.get("output"):
-            output = result["output"]
-            if output.get("text"):
-                ai_content = output["text"]
-            elif output.get("choices") and len(output["choices"]) > 0:
-                ai_content = output["choices"][0].get("message", {}).get("content", "") or output["choices"][0].get("text", "")
+        if not ai_content:
+            # 调用 LLM API（根据 task_type 选择服务）
+            response = _call_llm_api(messages, user_message=user_message, stream=False, force_provider=force_provider, **options)
+            result = response.json()
+            
+            # 提取AI回复
+            if result.get("choices") and len(result["choices"]) > 0:
+                ai_content = result["choices"][0].get("message", {}).get("content", "")
+            elif result.get("output"):
+                output = result["output"]
+                if output.get("text"):
+                    ai_content = output["text"]
+                elif output.get("choices") and len(output["choices"]) > 0:
+                    ai_content = output["choices"][0].get("message", {}).get("content", "") or output["choices"][0].get("text", "")
+            
+            semantic_cache.store(user_message, cache_key, ai_content)
         
         if not ai_content:
             ai_content = "抱歉，我暂时无法理解您的问题，请换个方式提问。"
 
-        # 保存AI回复
-        _save_message(session_id, "assistant", ai_content)
-        
-        # 更新会话
-        _create_or_update_session(session_id)
+        # 后台保存本轮消息：会话 upsert（刷新 updated_at）与消息写入合并在同一次持久化中完成
+        _persist_turn_async([user_row, _message_row(session_id, "assistant", ai_content)])
         
-        return jsonify({
+        return _json_response({
             "code": 200,
             "message": "success",
             "data": {
@@ -533,10 +1306,7 @@ def chat():
                 "content": ai_content,
                 "evidence": used_evidence,  # NEW: 返回证据
                 "sources": sources_payload,
-                "conversation_history": conversation_history + [
-                    {"role": "user", "content": user_message},
-                    {"role": "assistant", "content": ai_content}
-                ]
+                "conversation_history": _append_turn(conversation_history, user_message, ai_content)
             }
         })
         
@@ -557,49 +1327,66 @@ def chat():
 def chat_stream():
     """流式聊天接口（SSE）"""
     try:
-        data = request.get_json()
-        user_message = data.get("message", "").strip()
-        session_id = data.get("session_id") or str(uuid.uuid4())
+        try:
+            data = _get_json()
+        except ValueError:
+            return jsonify({"code": 400, "message": "请求体必须是合法的 JSON 对象", "data": None}), 400
+        try:
+            req = _parse_chat_request(data)
+        except ValueError as e:
+            return jsonify({"code": 400, "message": str(e), "data": None}), 400
+        user_message = req["message"]
+        session_id = req["session_id"] or str(uuid.uuid4())
         
         # 从配置文件获取系统提示词（不再从前端传递）
-        temporary_prompts = data.get("temporary_prompts", [])  # 前端可以传递临时提示词
-        system_prompt = build_system_prompt(temporary_prompts=temporary_prompts)
+        system_prompt = _get_system_prompt(req["temporary_prompts"])
         
-        conversation_history = data.get("conversation_history", [])
-        options = data.get("options", {})
-        task_type = data.get("task_type", "auto")  # 任务类型：'research' 强制使用 GPT-Researcher, 'chat' 使用 Qwen, 'auto' 自动路由
+        conversation_history = _resolve_history(data)
+        if conversation_history is None:
+            return jsonify({"code": 400, "message": "conversation_history 格式不正确", "data": None}), 400
+        options = _resolve_options(req["options"])
+        task_type = req["task_type"]
         
-        # 合并默认选项
-        default_options = get_default_options()
-        options = {**default_options, **options}
-        
-        if not user_message:
-            return jsonify({"code": 400, "message": "消息内容不能为空", "data": None}), 400
+        # 重复提交检测查库与检索并发进行，检索完成后、调用 LLM 前取结果
+        duplicate_future = _start_duplicate_check(req["session_id"], user_message)
         
         # 构建消息列表（本地 RAG + 联网搜索）
-        use_rag = data.get("use_rag", False)
-        use_web_search = data.get("use_web_search", False)
         retrieval = _build_retrieval_messages(
             user_message=user_message,
             system_prompt=system_prompt,
             conversation_history=conversation_history,
-            use_rag=use_rag,
-            use_web_search=use_web_search,
+            use_rag=req["use_rag"],
+            use_web_search=req["use_web_search"],
         )
+        
+        # 重复提交：整段上次回复作为一个 chunk 下发，事件序列与正常流一致
+        duplicate_reply = duplicate_future.result() if duplicate_future else None
+        if duplicate_reply is not None:
+            def replay():
+                yield _sse({'type': 'start', 'session_id': session_id})
+                yield _EMPTY_EVIDENCE_FRAME
+                yield _sse_chunk(duplicate_reply)
+                yield _sse({'type': 'done', 'session_id': session_id})
+            
+            response = _sse_response(replay())
+            response.headers["X-Cache"] = "HIT"
+            return response
+        
         messages = retrieval["messages"]
         used_evidence = retrieval["used_evidence"]
+        cache_key = semantic_cache.context_key(messages, task_type=task_type, options=options)
         
-        # 先创建或更新会话（确保会话存在）
-        _create_or_update_session(session_id)
-        
-        # 保存用户消息
-        user_message_id = str(uuid.uuid4())
-        _save_message(session_id, "user", user_message, user_message_id)
+        # 用户消息延后到流结束时与AI回复、会话一起写入
+        user_row = _message_row(session_id, "user", user_message, str(uuid.uuid4()))
         
         def generate():
             """生成流式响应"""
-            ai_content = ""
+            # 流式片段先收集到列表，结束时一次拼接（避免逐段 += 反复复制整段回答）
+            ai_parts: List[str] = []
+            ai_chars = 0
             ai_message_id = str(uuid.uuid4())
+            pending_rows = [user_row]
+            persisted = False
             
             try:
                 # 根据 task_type 决定使用哪个服务
@@ -611,196 +1398,158 @@ def chat_stream():
                     # 前端明确指定使用 GPT-Researcher
                     use_gpt_researcher = True
                     force_provider = 'gpt-researcher'
-                    print(f"🎯 [任务控制] 前端指定使用 GPT-Researcher（研究任务）")
+                    logger.info("🎯 [任务控制] 前端指定使用 GPT-Researcher（研究任务）")
                 elif task_type == 'data':
                     # 前端明确指定使用 DeepAnalyze
                     use_deepanalyze = True
                     force_provider = 'deepanalyze'
-                    print(f"🎯 [任务控制] 前端指定使用 DeepAnalyze（数据分析任务）")
+                    logger.info("🎯 [任务控制] 前端指定使用 DeepAnalyze（数据分析任务）")
                 elif task_type == 'chat':
                     # 前端明确指定使用 Qwen
                     force_provider = 'qwen'
-                    print(f"🎯 [任务控制] 前端指定使用 Qwen（聊天任务）")
+                    logger.info("🎯 [任务控制] 前端指定使用 Qwen（聊天任务）")
                 elif AUTO_ROUTE_TASKS and (USE_GPT_RESEARCHER or USE_DEEPANALYZE) and user_message:
                     # 自动路由
                     detected_task_type = detect_task_type(user_message)
                     if detected_task_type == 'research' and USE_GPT_RESEARCHER:
                         use_gpt_researcher = True
-                        print(f"🔍 [任务路由] 自动检测到研究任务，路由到 GPT-Researcher")
-                        print(f"   用户消息: {user_message[:50]}...")
+                        logger.info("🔍 [任务路由] 自动检测到研究任务，路由到 GPT-Researcher")
+                        logger.debug("用户消息: %s...", user_message[:50])
                     elif detected_task_type == 'data' and USE_DEEPANALYZE:
                         use_deepanalyze = True
-                        print(f"🔍 [任务路由] 自动检测到数据分析任务，路由到 DeepAnalyze")
-                        print(f"   用户消息: {user_message[:50]}...")
+                        logger.info("🔍 [任务路由] 自动检测到数据分析任务，路由到 DeepAnalyze")
+                        logger.debug("用户消息: %s...", user_message[:50])
                     else:
-                        print(f"🔍 [任务路由] 自动检测到{detected_task_type}任务，使用默认服务 (Qwen)")
+                        # 已判定走默认服务，显式指定，避免 _call_llm_api 内再检测一次
+                        force_provider = 'qwen'
+                        logger.info("🔍 [任务路由] 自动检测到%s任务，使用默认服务 (Qwen)", detected_task_type)
                 else:
                     if not AUTO_ROUTE_TASKS:
-                        print(f"🔍 [任务路由] 自动路由已禁用，使用默认服务")
+                        logger.info("🔍 [任务路由] 自动路由已禁用，使用默认服务")
                     elif not USE_GPT_RESEARCHER and not USE_DEEPANALYZE:
-                        print(f"🔍 [任务路由] GPT-Researcher 和 DeepAnalyze 已禁用，使用默认服务")
+                        logger.info("🔍 [任务路由] GPT-Researcher 和 DeepAnalyze 已禁用，使用默认服务")
                 
+                # 先发一个注释帧，促使代理立即建立下行通道
+                yield _SSE_OPEN_FRAME
                 # 发送初始事件
-                yield f"data: {json.dumps({'type': 'start', 'session_id': session_id}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'start', 'session_id': session_id})
                 # NEW: 推送证据事件（空列表也发送，方便前端处理）
-                if used_evidence:
-                    yield f"data: {json.dumps({'type': 'evidence', 'items': used_evidence}, ensure_ascii=False)}\n\n"
-                elif used_evidence == []:
-                    yield f"data: {json.dumps({'type': 'evidence', 'items': []}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'evidence', 'items': used_evidence}) if used_evidence else _EMPTY_EVIDENCE_FRAME
                 
-                if use_gpt_researcher:
+                cached_content = semantic_cache.lookup(user_message, cache_key)
+                if cached_content:
+                    # 语义缓存命中：整段回答作为一个 chunk 下发，事件格式不变
+                    ai_parts.append(cached_content)
+                    yield _sse_chunk(cached_content)
+                elif use_gpt_researcher:
                     # 使用 GPT-Researcher（支持进度显示）
-                    print(f"🚀 [GPT-Researcher] 开始调用研究服务...")
+                    logger.info("🚀 [GPT-Researcher] 开始调用研究服务...")
                     adapter = get_gpt_researcher_adapter()
                     
                     # 定义进度回调函数（用于发送进度到前端）
-                    progress_queue = []
+                    progress_queue = deque()
                     def progress_callback(progress_data):
                         """将进度信息添加到队列，稍后通过 SSE 发送"""
                         progress_queue.append(progress_data)
                     
                     chunk_count = 0
-                    for chunk in adapter.chat_completions_stream(
+                    # 研究过程可能长时间没有内容输出：空闲时先推送累积的进度，没有进度再发心跳帧保活
+                    for chunk in _with_heartbeat(adapter.chat_completions_stream(
                         messages, 
                         progress_callback=progress_callback,
                         **options
-                    ):
+                    )):
+                        if chunk is _IDLE and not progress_queue:
+                            yield _SSE_HEARTBEAT_FRAME
+                            continue
                         # 先发送所有累积的进度信息
                         while progress_queue:
-                            progress_data = progress_queue.pop(0)
-                            progress_json = json.dumps(progress_data, ensure_ascii=False)
-                            yield f"data: {progress_json}\n\n"
+                            progress_data = progress_queue.popleft()
+                            yield _sse(progress_data)
+                        if chunk is _IDLE:
+                            continue
                         
                         # 处理内容块
                         content = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
                         if content:
-                            ai_content += content
-                            chunk_data = json.dumps({'type': 'chunk', 'content': content}, ensure_ascii=False)
-                            yield f"data: {chunk_data}\n\n"
+                            ai_parts.append(content)
+                            ai_chars += len(content)
+                            yield _sse_chunk(content)
                             chunk_count += 1
-                            # 只在前几个chunk打印日志，避免日志过多
-                            if chunk_count <= 3:
-                                print(f"📤 [GPT-Researcher] 发送chunk #{chunk_count}: {content[:30]}...")
+                            # 调试模式下只在前几个chunk打印日志，避免日志过多
+                            if DEBUG_STREAM_LOG and chunk_count <= 3:
+                                logger.debug("📤 [GPT-Researcher] 发送chunk #%d: %s...", chunk_count, content[:30])
                     
                     # 发送剩余的进度信息
                     while progress_queue:
-                        progress_data = progress_queue.pop(0)
-                        progress_json = json.dumps(progress_data, ensure_ascii=False)
-                        yield f"data: {progress_json}\n\n"
+                        progress_data = progress_queue.popleft()
+                        yield _sse(progress_data)
                     
-                    print(f"✅ [GPT-Researcher] 完成，共发送 {chunk_count} 个chunks，总长度: {len(ai_content)} 字符")
+                    logger.info("✅ [GPT-Researcher] 完成，共发送 %s 个chunks，总长度: %s 字符", chunk_count, ai_chars)
                 elif use_deepanalyze:
                     # 使用 DeepAnalyze API（原生流式支持）
-                    print(f"🚀 [DeepAnalyze] 开始调用数据分析服务...")
+                    logger.info("🚀 [DeepAnalyze] 开始调用数据分析服务...")
                     adapter = get_deepanalyze_adapter()
                     
                     chunk_count = 0
-                    for chunk in adapter.chat_completions_stream(messages, **options):
+                    for chunk in _with_heartbeat(adapter.chat_completions_stream(messages, **options)):
+                        if chunk is _IDLE:
+                            yield _SSE_HEARTBEAT_FRAME
+                            continue
                         # 处理内容块
                         content = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
                         if content:
-                            ai_content += content
-                            chunk_data = json.dumps({'type': 'chunk', 'content': content}, ensure_ascii=False)
-                            yield f"data: {chunk_data}\n\n"
+                            ai_parts.append(content)
+                            ai_chars += len(content)
+                            yield _sse_chunk(content)
                             chunk_count += 1
-                            # 只在前几个chunk打印日志，避免日志过多
-                            if chunk_count <= 3:
-                                print(f"📤 [DeepAnalyze] 发送chunk #{chunk_count}: {content[:30]}...")
+                            # 调试模式下只在前几个chunk打印日志，避免日志过多
+                            if DEBUG_STREAM_LOG and chunk_count <= 3:
+                                logger.debug("📤 [DeepAnalyze] 发送chunk #%d: %s...", chunk_count, content[:30])
                     
-                    print(f"✅ [DeepAnalyze] 完成，共发送 {chunk_count} 个chunks，总长度: {len(ai_content)} 字符")
+                    logger.info("✅ [DeepAnalyze] 完成，共发送 %s 个chunks，总长度: %s 字符", chunk_count, ai_chars)
                 else:
                     # 使用 Qwen API（真正的流式）
                     response = _call_llm_api(messages, user_message=user_message, stream=True, force_provider=force_provider, **options)
                     
-                    # 处理流式响应
-                    for line in response.iter_lines():
-                        if not line:
-                            continue
-                        
-                        line_str = line.decode("utf-8")
-                        
-                        # 跳过空行和注释行
-                        if not line_str.strip() or line_str.startswith(':'):
-                            continue
-                        
-                        # 移除 "data: " 前缀（如果存在）
-                        if line_str.startswith("data: "):
-                            line_str = line_str[6:]
-                        
-                        # 检查结束标记
-                        if line_str.strip() == "[DONE]" or line_str.strip() == 'data:[DONE]':
-                            break
-                        
-                        try:
-                            chunk_data = json.loads(line_str)
-                            
-                            # 尝试多种格式解析
-                            content = ""
-                            
-                            # OpenAI兼容格式
-                            if "choices" in chunk_data and len(chunk_data["choices"]) > 0:
-                                delta = chunk_data["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                            
-                            # DashScope格式（Qwen可能使用）
-                            elif "output" in chunk_data:
-                                output = chunk_data["output"]
-                                if "choices" in output and len(output["choices"]) > 0:
-                                    choice = output["choices"][0]
-                                    if "delta" in choice:
-                                        content = choice["delta"].get("content", "")
-                                    elif "message" in choice:
-                                        content = choice["message"].get("content", "")
-                                    elif "text" in choice:
-                                        content = choice.get("text", "")
-                                elif "text" in output:
-                                    content = output.get("text", "")
-                            
-                            # 直接文本格式
-                            elif "text" in chunk_data:
-                                content = chunk_data.get("text", "")
-                            
-                            # 如果找到内容，立即发送
-                            if content:
-                                ai_content += content
-                                # 立即flush，确保实时传输
-                                chunk_data = json.dumps({'type': 'chunk', 'content': content}, ensure_ascii=False)
-                                yield f"data: {chunk_data}\n\n"
-                                # 调试：打印发送的chunk（仅前几个字符）
-                                if len(ai_content) <= 50:
-                                    print(f"📤 [Qwen] 发送chunk: {content[:20]}...")
-                                
-                        except json.JSONDecodeError as e:
-                            # 如果不是JSON格式，可能是纯文本，跳过
-                            print(f"⚠️ 解析流式数据失败: {e}, 行内容: {line_str[:100]}")
-                            continue
-                        except Exception as e:
-                            print(f"⚠️ 处理流式数据出错: {e}")
+                    # 处理流式响应：逐字输出的短片段合并后再发送（最多延迟 SSE_COALESCE_MS 毫秒），
+                    # 模型长时间无输出时发送心跳帧保活
+                    for content in _coalesce_text(_iter_stream_content(response)):
+                        if content is _IDLE:
+                            yield _SSE_HEARTBEAT_FRAME
                             continue
+                        ai_parts.append(content)
+                        ai_chars += len(content)
+                        yield _sse_chunk(content)
+                        # 调试：打印发送的chunk（仅前几个字符）
+                        if DEBUG_STREAM_LOG and ai_chars <= 50:
+                            logger.debug("📤 [Qwen] 发送chunk: %s...", content[:20])
+                
+                ai_content = "".join(ai_parts)
+                # 保存完整的AI回复（先提交后台写库，再发送完成事件，连接关闭无需等待写库）
+                default_msg = "抱歉，我暂时无法理解您的问题，请换个方式提问。"
+                pending_rows.append(_message_row(session_id, "assistant", ai_content or default_msg, ai_message_id))
+                _persist_turn_async(pending_rows)
+                persisted = True
                 
                 # 发送完成事件
-                yield f"data: {json.dumps({'type': 'done', 'session_id': session_id}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'done', 'session_id': session_id})
                 
-                # 保存完整的AI回复
-                if ai_content:
-                    _save_message(session_id, "assistant", ai_content, ai_message_id)
-                    _create_or_update_session(session_id)
-                else:
-                    # 如果没有收到内容，保存默认消息
-                    default_msg = "抱歉，我暂时无法理解您的问题，请换个方式提问。"
-                    _save_message(session_id, "assistant", default_msg, ai_message_id)
-                    yield f"data: {json.dumps({'type': 'error', 'message': default_msg}, ensure_ascii=False)}\n\n"
+                if not ai_content:
+                    # 如果没有收到内容，提示默认消息
+                    yield _sse({'type': 'error', 'message': default_msg})
+                elif not cached_content:
+                    semantic_cache.store(user_message, cache_key, ai_content)
                     
             except Exception as e:
                 error_msg = f"流式传输错误: {str(e)}"
-                yield f"data: {json.dumps({'type': 'error', 'message': error_msg}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'error', 'message': error_msg})
+            finally:
+                # 出错或客户端断开时至少保留用户消息
+                if not persisted:
+                    _persist_turn_async(pending_rows)
         
-        response = make_response(stream_with_context(generate()))
-        response.headers["Content-Type"] = "text/event-stream; charset=utf-8"
-        response.headers["Cache-Control"] = "no-cache, no-transform"
-        response.headers["Connection"] = "keep-alive"
-        response.headers["X-Accel-Buffering"] = "no"  # 禁用Nginx缓冲
-        return response
+        return _sse_response(generate())
         
     except Exception as e:
         return jsonify({"code": 500, "message": f"服务器错误: {str(e)}", "data": None}), 500
@@ -812,22 +1561,19 @@ def get_chat_history():
     try:
         session_id = request.args.get("session_id")
         limit = int(request.args.get("limit", 50))
+        after = request.args.get("after") or None
         
         if not session_id:
             return jsonify({"code": 400, "message": "session_id参数必填", "data": None}), 400
+        if after is not None:
+            try:
+                datetime.fromisoformat(after.replace("Z", "+00:00"))
+            except ValueError:
+                return jsonify({"code": 400, "message": "after 必须是 ISO8601 时间", "data": None}), 400
         
-        history = _get_chat_history(session_id, limit)
-        
-        # 转换为前端需要的格式
-        messages = []
-        for msg in history:
-            messages.append({
-                "role": msg.get("role"),
-                "content": msg.get("content"),
-                "time": msg.get("created_at", ""),
-            })
+        messages = _get_chat_history(session_id, limit, after)
         
-        return jsonify({
+        response = _json_response({
             "code": 200,
             "message": "success",
             "data": {
@@ -835,6 +1581,8 @@ def get_chat_history():
                 "messages": messages
             }
         })
+        # 前端轮询时携带 If-None-Match，内容未变化直接返回 304，不再传输整段记录
+        return apply_weak_etag(response, "private, no-cache")
         
     except Exception as e:
         return jsonify({"code": 500, "message": f"服务器错误: {str(e)}", "data": None}), 500
@@ -843,21 +1591,21 @@ def get_chat_history():
 @agent_chat_bp.route("/chat/sessions", methods=["GET"])
 def get_chat_sessions():
     """获取所有聊天会话列表"""
-    if not _supabase:
-        return jsonify({"code": 200, "message": "success", "data": {"sessions": []}})
+    sb = _get_supabase()
+    if not sb:
+        return _json_response({"code": 200, "message": "success", "data": {"sessions": []}})
     
     try:
         limit = int(request.args.get("limit", 20))
-        result = (
-            _supabase.table(CHAT_SESSIONS_TABLE)
-            .select("*")
+        result = _execute(
+            sb.table(CHAT_SESSIONS_TABLE)
+            .select("id,title,created_at,updated_at")
             .order("updated_at", desc=True)
             .limit(limit)
-            .execute()
         )
         
         sessions = result.data or []
-        return jsonify({
+        return _json_response({
             "code": 200,
             "message": "success",
             "data": {"sessions": sessions}
@@ -869,14 +1617,15 @@ def get_chat_sessions():
 @agent_chat_bp.route("/chat/sessions/<session_id>", methods=["DELETE"])
 def delete_chat_session(session_id):
     """删除聊天会话及其所有消息"""
-    if not _supabase:
+    sb = _get_supabase()
+    if not sb:
         return jsonify({"code": 200, "message": "success", "data": None})
     
     try:
-        # 删除消息
-        _supabase.table(CHAT_MESSAGES_TABLE).delete().eq("session_id", session_id).execute()
-        # 删除会话
-        _supabase.table(CHAT_SESSIONS_TABLE).delete().eq("id", session_id).execute()
+        # 只删除会话：chat_messages.session_id 外键为 ON DELETE CASCADE（见 chat_tables.sql），
+        # 消息在同一事务中级联删除，一次请求且不会留下孤立消息
+        _execute(sb.table(CHAT_SESSIONS_TABLE).delete().eq("id", session_id))
+        _invalidate_history_cache(session_id)
         
         return jsonify({
             "code": 200,
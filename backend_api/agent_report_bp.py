@@ -9,13 +9,19 @@
     - 返回结构严格遵循 agent-report-api.md 约定
 """
 
-import json
 import os
+import random
+import re
+import socket
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
+import orjson
 import requests
 
 from flask import Blueprint, make_response
@@ -23,12 +29,22 @@ from flask import Blueprint, make_response
 from infra import llm
 from infra.db import supabase
 
+from backend_api.web_search import TAVILY_HTTP, TAVILY_SEARCH_URL
+
 # ===== 配置 =====
 AGENT_REPORT_SOURCE = os.getenv("AGENT_REPORT_SOURCE", "agent_initial_report_view")
+# 报告数据源只取用到的列；视图缺少其中某列时自动回退为 select("*")
+AGENT_REPORT_SOURCE_COLUMNS = os.getenv(
+    "AGENT_REPORT_SOURCE_COLUMNS",
+    "id,title,content,icon,priority,updated_at,created_at,generated_at,sources",
+)
 AGENT_REPORT_LIMIT = int(os.getenv("AGENT_REPORT_LIMIT", "12"))
 AGENT_REPORT_CACHE_TABLE = os.getenv("AGENT_REPORT_CACHE_TABLE", "agent_daily_report_cache")
 AGENT_REPORT_SEARCH_DEPTH = os.getenv("AGENT_REPORT_SEARCH_DEPTH", "basic").strip() or "basic"
 AGENT_REPORT_SEARCH_MAX_RESULTS = int(os.getenv("AGENT_REPORT_SEARCH_MAX_RESULTS", "6"))
+# Tavily 配置在导入时读取一次（app.py 在注册 Blueprint 之前已加载 .env）
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY", "").strip()
+TAVILY_TIMEOUT = int(os.getenv("TAVILY_TIMEOUT", "25"))
 AGENT_REPORT_SOURCE_LIMIT = int(os.getenv("AGENT_REPORT_SOURCE_LIMIT", "6"))
 AGENT_REPORT_SUMMARY_MODEL = os.getenv("AGENT_REPORT_SUMMARY_MODEL") or None
 AGENT_REPORT_REFRESH_MINUTES = int(os.getenv("AGENT_REPORT_REFRESH_MINUTES", "1440"))
@@ -37,8 +53,38 @@ AGENT_REPORT_GENERATION_ENABLED = (
     in {"1", "true", "yes", "on"}
 )
 
+# 后台定时刷新：每天 AGENT_REPORT_REFRESH_AT（本地时间 HH:MM）生成一次，请求路径只读缓存
+AGENT_REPORT_SCHEDULER_ENABLED = (
+    os.getenv("AGENT_REPORT_SCHEDULER_ENABLED", "true").strip().lower()
+    in {"1", "true", "yes", "on"}
+)
+AGENT_REPORT_REFRESH_AT = os.getenv("AGENT_REPORT_REFRESH_AT", "01:30").strip() or "01:30"
+# 多个 worker 各自调度时随机错开（秒），先到的 worker 生成并写库，其余直接读取
+AGENT_REPORT_SCHEDULER_JITTER = int(os.getenv("AGENT_REPORT_SCHEDULER_JITTER", "120"))
+# 跨进程/跨实例的生成租约（agent_cache_tables.sql）：拿到租约的进程才调用 Tavily/LLM，
+# 租约在生成结束时释放，进程异常退出时 AGENT_REPORT_LEASE_SECONDS 秒后自动过期
+AGENT_REPORT_LEASE_RPC = os.getenv("AGENT_REPORT_LEASE_RPC", "try_acquire_report_refresh_lease").strip()
+AGENT_REPORT_LEASE_SECONDS = int(os.getenv("AGENT_REPORT_LEASE_SECONDS", "900"))
+_LEASE_TABLE = "agent_report_refresh_lease"
+_LEASE_KEY = "initial-report"
+_LEASE_HOLDER = f"{socket.gethostname()}:{os.getpid()}"
+# refresh=1 且缓存超过该小时数时，先返回旧缓存，后台刷新
+AGENT_REPORT_STALE_HOURS = float(os.getenv("AGENT_REPORT_STALE_HOURS", "6"))
+
+# 响应默认紧凑输出；本地调试时 AGENT_REPORT_PRETTY=1 输出 2 空格缩进
+AGENT_REPORT_PRETTY = os.getenv("AGENT_REPORT_PRETTY", "0").strip() == "1"
+_JSON_OPTIONS = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if AGENT_REPORT_PRETTY else 0)
+
 REPORT_CACHE_LOCK = threading.Lock()
-REPORT_CACHE_STATE: Dict[str, Any] = {"generatedAt": None, "payload": None}
+# 同一时刻只允许一个生成任务（定时刷新 / 后台刷新）
+REPORT_REFRESH_LOCK = threading.Lock()
+# 缓存过期时由请求触发后台刷新，两次触发之间至少间隔的秒数（避免生成失败时每个请求都重试）
+_STALE_REFRESH_INTERVAL = 300
+_last_background_refresh = float("-inf")
+_scheduler_started = False
+_scheduler_lock = threading.Lock()
+# bodies: source -> 当前 payload 序列化后的响应体；payload 更新时清空
+REPORT_CACHE_STATE: Dict[str, Any] = {"generatedAt": None, "payload": None, "bodies": {}}
 
 SECTION_CONFIGS = [
     {
@@ -68,6 +114,8 @@ SECTION_CONFIGS = [
 ]
 
 agent_report_bp = Blueprint("agent_report", __name__)
+# 栏目生成线程池：跨请求复用，每个栏目一个线程
+_SECTION_POOL = ThreadPoolExecutor(max_workers=len(SECTION_CONFIGS), thread_name_prefix="agent-report")
 _supabase = supabase
 
 # ===== 回退数据（与文档示例一致） =====
@@ -143,23 +191,36 @@ def _to_iso(value: Optional[Any]) -> Optional[str]:
         dt = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
         return dt.replace(microsecond=0).isoformat().replace("+00:00", "Z")
     if isinstance(value, str):
-        txt = value.strip()
-        if not txt:
-            return None
-        try:
-            if txt.endswith("Z"):
-                txt = txt.replace("Z", "+00:00")
-            dt = datetime.fromisoformat(txt)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            else:
-                dt = dt.astimezone(timezone.utc)
-            return dt.replace(microsecond=0).isoformat().replace("+00:00", "Z")
-        except Exception:
-            return value
+        return _to_iso_str(value)
     return None
 
 
+@lru_cache(maxsize=2048)
+def _to_iso_str(value: str) -> Optional[str]:
+    """字符串输入的转换结果只取决于字符串本身，按值缓存（同一时间戳在多行/多次请求中反复出现）"""
+    txt = value.strip()
+    if not txt:
+        return None
+    # 常见形态直接按位校验：YYYY-MM-DDTHH:MM:SSZ 原样返回，YYYY-MM-DDTHH:MM:SS+00:00 换成 Z 结尾
+    if (len(txt) == 20 or len(txt) == 25) and txt[4] == "-" and txt[7] == "-" and txt[10] == "T" \
+            and txt[13] == ":" and txt[16] == ":":
+        if len(txt) == 20 and txt[19] == "Z":
+            return txt
+        if len(txt) == 25 and txt.endswith("+00:00"):
+            return txt[:19] + "Z"
+    try:
+        if txt.endswith("Z"):
+            txt = txt.replace("Z", "+00:00")
+        dt = datetime.fromisoformat(txt)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        else:
+            dt = dt.astimezone(timezone.utc)
+        return dt.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    except Exception:
+        return value
+
+
 def _parse_datetime(value: Optional[Any]) -> Optional[datetime]:
     if value is None:
         return None
@@ -193,8 +254,13 @@ def _is_fresh(generated_at: Optional[str], now: Optional[datetime] = None) -> bo
     return now - dt <= timedelta(minutes=AGENT_REPORT_REFRESH_MINUTES)
 
 
+def _is_recent(generated_at: Optional[str], max_age: timedelta) -> bool:
+    dt = _parse_datetime(generated_at)
+    return bool(dt) and datetime.now(timezone.utc) - dt <= max_age
+
+
 def _get_tavily_key() -> str:
-    return os.getenv("TAVILY_API_KEY", "").strip()
+    return TAVILY_API_KEY
 
 
 def _today_key() -> str:
@@ -207,7 +273,7 @@ def _fetch_cached_report(date_key: str) -> Optional[Tuple[str, List[Dict[str, An
     try:
         res = (
             _supabase.table(AGENT_REPORT_CACHE_TABLE)
-            .select("generated_at, sections, source, updated_at")
+            .select("generated_at, sections, updated_at")
             .eq("cache_date", date_key)
             .order("updated_at", desc=True)
             .limit(1)
@@ -232,7 +298,7 @@ def _fetch_latest_cached_report() -> Optional[Tuple[str, List[Dict[str, Any]]]]:
     try:
         res = (
             _supabase.table(AGENT_REPORT_CACHE_TABLE)
-            .select("cache_date, generated_at, sections, source, updated_at, created_at")
+            .select("generated_at, sections, updated_at, created_at")
             .order("generated_at", desc=True)
             .order("updated_at", desc=True)
             .limit(1)
@@ -285,7 +351,11 @@ def _save_cached_report(
 def _normalize_date(value: Optional[Any]) -> Optional[str]:
     if not value:
         return None
-    text = str(value).strip()
+    return _normalize_date_str(str(value).strip())
+
+
+@lru_cache(maxsize=2048)
+def _normalize_date_str(text: str) -> Optional[str]:
     if not text:
         return None
     try:
@@ -297,6 +367,7 @@ def _normalize_date(value: Optional[Any]) -> Optional[str]:
         return text[:10] if len(text) >= 10 else None
 
 
+@lru_cache(maxsize=2048)
 def _extract_source_name(url: str) -> str:
     if not url:
         return ""
@@ -307,10 +378,19 @@ def _extract_source_name(url: str) -> str:
         return ""
 
 
+_WS_RE = re.compile(r"\s+")
+# 连续空白或非普通空格的空白字符（换行、制表符、全角空格等）
+_WS_TO_COLLAPSE_RE = re.compile(r"\s{2,}|[^\S ]")
+
+
 def _truncate(text: str, limit: int) -> str:
     if not text:
         return ""
-    cleaned = " ".join(text.split())
+    if _WS_TO_COLLAPSE_RE.search(text) is None:
+        # 只有单个普通空格（常见于标题和单行摘要），无需替换
+        cleaned = text.strip(" ")
+    else:
+        cleaned = _WS_RE.sub(" ", text).strip()
     if len(cleaned) <= limit:
         return cleaned
     return cleaned[:limit].rstrip() + "..."
@@ -339,15 +419,13 @@ def _normalize_tavily_result(raw: dict) -> dict:
 
 
 def _dedupe_results(results: List[dict]) -> List[dict]:
-    seen = set()
-    deduped = []
+    # dict 保持插入顺序；setdefault 保留每个 key 第一次出现的结果
+    seen: Dict[str, dict] = {}
     for item in results:
         key = item.get("url") or item.get("title")
-        if not key or key in seen:
-            continue
-        seen.add(key)
-        deduped.append(item)
-    return deduped
+        if key:
+            seen.setdefault(key, item)
+    return list(seen.values())
 
 
 def _call_tavily_search(query: str, max_results: int) -> List[dict]:
@@ -363,9 +441,8 @@ def _call_tavily_search(query: str, max_results: int) -> List[dict]:
         "include_images": False,
         "include_raw_content": False,
     }
-    timeout = int(os.getenv("TAVILY_TIMEOUT", "25"))
     try:
-        response = requests.post("https://api.tavily.com/search", json=payload, timeout=timeout)
+        response = TAVILY_HTTP.post(TAVILY_SEARCH_URL, json=payload, timeout=TAVILY_TIMEOUT)
         response.raise_for_status()
         data = response.json() or {}
     except requests.RequestException as exc:
@@ -443,50 +520,63 @@ def _llm_summarize_section(heading: str, results: List[dict]) -> str:
     return "\n".join(fallback_lines) or "- 暂无可靠公开信息，可稍后刷新查看"
 
 
-def _build_dynamic_sections() -> Tuple[str, List[Dict[str, Any]]]:
-    generated_at = _to_iso(datetime.now(timezone.utc)) or _FALLBACK_GENERATED_AT
-    sections: List[Dict[str, Any]] = []
-
-    for section in SECTION_CONFIGS:
-        try:
-            results = _call_tavily_search(
-                section["query"],
-                max_results=AGENT_REPORT_SEARCH_MAX_RESULTS,
-            )
-        except Exception as exc:
-            print(f"⚠️ Tavily 搜索失败 [{section['title']}]: {exc}")
-            results = []
-        summary = _llm_summarize_section(section["heading"], results)
-        content = f"## {section['heading']}\n\n{summary}"
-
-        sources = []
-        for item in results[:AGENT_REPORT_SOURCE_LIMIT]:
-            sources.append(
-                {
-                    "title": item.get("title"),
-                    "url": item.get("url"),
-                    "source": item.get("source"),
-                    "publishedAt": item.get("publishedAt"),
-                }
-            )
-
-        sections.append(
+def _build_one_section(section: Dict[str, Any], generated_at: str) -> Dict[str, Any]:
+    """单个栏目：Tavily 检索 + LLM 摘要；各栏目互不依赖，可并发执行"""
+    try:
+        results = _call_tavily_search(
+            section["query"],
+            max_results=AGENT_REPORT_SEARCH_MAX_RESULTS,
+        )
+    except Exception as exc:
+        print(f"⚠️ Tavily 搜索失败 [{section['title']}]: {exc}")
+        results = []
+    summary = _llm_summarize_section(section["heading"], results)
+    content = f"## {section['heading']}\n\n{summary}"
+
+    sources = []
+    for item in results[:AGENT_REPORT_SOURCE_LIMIT]:
+        sources.append(
             {
-                "id": section["id"],
-                "title": section["title"],
-                "icon": section["icon"],
-                "content": content,
-                "priority": section["priority"],
-                "updatedAt": generated_at,
-                "sources": sources,
+                "title": item.get("title"),
+                "url": item.get("url"),
+                "source": item.get("source"),
+                "publishedAt": item.get("publishedAt"),
             }
         )
 
+    return {
+        "id": section["id"],
+        "title": section["title"],
+        "icon": section["icon"],
+        "content": content,
+        "priority": section["priority"],
+        "updatedAt": generated_at,
+        "sources": sources,
+    }
+
+
+def _build_dynamic_sections() -> Tuple[str, List[Dict[str, Any]]]:
+    generated_at = _to_iso(datetime.now(timezone.utc)) or _FALLBACK_GENERATED_AT
+    # 各栏目并发检索与摘要，总耗时取决于最慢的一个栏目
+    sections = list(
+        _SECTION_POOL.map(lambda section: _build_one_section(section, generated_at), SECTION_CONFIGS)
+    )
     sections.sort(key=lambda s: (s.get("priority", 99), s.get("id", 0)))
     return generated_at, sections
 
 
-def _get_cached_or_refresh(force_refresh: bool, can_generate: bool) -> Tuple[str, List[Dict[str, Any]], str]:
+def _set_report_cache(generated_at: str, sections: List[Dict[str, Any]]) -> None:
+    with REPORT_CACHE_LOCK:
+        REPORT_CACHE_STATE["generatedAt"] = generated_at
+        REPORT_CACHE_STATE["payload"] = {"generatedAt": generated_at, "sections": sections}
+        REPORT_CACHE_STATE["bodies"] = {}
+
+
+def _get_cached_report(force_refresh: bool) -> Tuple[str, List[Dict[str, Any]], str]:
+    """
+    只读缓存，不在请求路径上生成：进程内缓存 -> 库中最新一条。
+    库中缓存已过期时返回 source="cache-stale"，由调用方安排后台刷新；两处均无缓存时抛出 RuntimeError。
+    """
     now = datetime.now(timezone.utc)
 
     if not force_refresh:
@@ -497,44 +587,174 @@ def _get_cached_or_refresh(force_refresh: bool, can_generate: bool) -> Tuple[str
             return cached_payload["generatedAt"], cached_payload["sections"], "cache"
 
     cached_latest = _fetch_latest_cached_report()
-    if cached_latest:
-        generated_at, sections = cached_latest
-        payload = {"generatedAt": generated_at, "sections": sections}
-        with REPORT_CACHE_LOCK:
-            REPORT_CACHE_STATE["generatedAt"] = generated_at
-            REPORT_CACHE_STATE["payload"] = payload
-        if not force_refresh and _is_fresh(generated_at, now):
-            return generated_at, sections, "cache-db"
-        if not can_generate:
-            return generated_at, sections, "cache-stale"
-    elif not can_generate:
-        raise RuntimeError("report generation disabled and no cache available")
+    if not cached_latest:
+        raise RuntimeError("no cached report available")
+    generated_at, sections = cached_latest
+    _set_report_cache(generated_at, sections)
+    if not force_refresh and _is_fresh(generated_at, now):
+        return generated_at, sections, "cache-db"
+    return generated_at, sections, "cache-stale"
 
-    generated_at, sections = _build_dynamic_sections()
-    payload = {"generatedAt": generated_at, "sections": sections}
-    with REPORT_CACHE_LOCK:
-        REPORT_CACHE_STATE["generatedAt"] = generated_at
-        REPORT_CACHE_STATE["payload"] = payload
 
+def _generate_and_store() -> Tuple[str, List[Dict[str, Any]]]:
+    generated_at, sections = _build_dynamic_sections()
+    _set_report_cache(generated_at, sections)
     cache_date = _normalize_date(generated_at) or _today_key()
     _save_cached_report(cache_date, generated_at, sections, "tavily")
+    return generated_at, sections
+
+
+def _generate_exclusive(reason: str) -> Optional[Tuple[str, List[Dict[str, Any]], str]]:
+    """
+    生成报告的唯一入口，调用方须已持有 REPORT_REFRESH_LOCK（进程内互斥）。
+    其他 worker 刚生成过时直接采用库中的结果；否则抢占数据库租约（跨进程互斥）后生成，
+    租约被其他进程持有时返回 None。
+    """
+    latest = _fetch_latest_cached_report()
+    if latest and _is_recent(latest[0], timedelta(minutes=30)):
+        _set_report_cache(*latest)
+        print(f"[INFO] agent initial report refresh ({reason}) reused cache generatedAt={latest[0]}")
+        return latest[0], latest[1], "cache-db"
+    holder = f"{_LEASE_HOLDER}:{threading.get_ident()}"
+    if not _acquire_refresh_lease(holder):
+        print(f"[INFO] agent initial report refresh ({reason}) skipped: another process holds the lease")
+        return None
+    try:
+        generated_at, sections = _generate_and_store()
+    finally:
+        _release_refresh_lease(holder)
+    print(f"[INFO] agent initial report refresh ({reason}) done generatedAt={generated_at}")
     return generated_at, sections, "tavily"
 
 
-def _fetch_from_supabase(limit: int) -> Tuple[str, List[Dict[str, Any]]]:
-    if not _supabase:
-        raise RuntimeError("Supabase client not available")
+def _refresh_in_foreground(reason: str) -> Optional[Tuple[str, List[Dict[str, Any]], str]]:
+    """
+    请求内生成（无任何缓存或显式 refresh=1）：阻塞等待 REPORT_REFRESH_LOCK，
+    并发请求排队后直接复用前一个请求刚生成的结果，不会各自调用 Tavily/LLM
+    """
+    with REPORT_REFRESH_LOCK:
+        try:
+            return _generate_exclusive(reason)
+        except Exception as exc:
+            print(f"⚠️ 生成日报失败 ({reason}): {exc}")
+            return None
 
+
+def _seconds_until_next_run(now: Optional[datetime] = None) -> float:
+    """距下一次 AGENT_REPORT_REFRESH_AT（本地时间）的秒数；配置格式错误时按 01:30 处理"""
+    try:
+        hour, minute = (int(part) for part in AGENT_REPORT_REFRESH_AT.split(":", 1))
+        now = now or datetime.now()
+        target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    except Exception:
+        now = now or datetime.now()
+        target = now.replace(hour=1, minute=30, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def _acquire_refresh_lease(holder: str) -> bool:
+    """
+    抢占数据库中的生成租约；其他进程持有未过期租约时返回 False。
+    未配置 Supabase、未部署租约函数或请求失败时退化为进程内互斥（返回 True），不阻止生成。
+    """
+    if not _supabase or not AGENT_REPORT_LEASE_RPC:
+        return True
+    try:
+        res = _supabase.rpc(AGENT_REPORT_LEASE_RPC, {
+            "p_lease_key": _LEASE_KEY,
+            "p_holder": holder,
+            "p_ttl_seconds": AGENT_REPORT_LEASE_SECONDS,
+        }).execute()
+    except Exception as exc:
+        print(f"⚠️ 获取日报生成租约失败，按单进程处理: {exc}")
+        return True
+    return bool(res.data)
+
+
+def _release_refresh_lease(holder: str) -> None:
+    if not _supabase or not AGENT_REPORT_LEASE_RPC:
+        return
+    try:
+        _supabase.table(_LEASE_TABLE).delete().eq("lease_key", _LEASE_KEY).eq("holder", holder).execute()
+    except Exception as exc:
+        print(f"⚠️ 释放日报生成租约失败（将在到期后自动失效）: {exc}")
+
+
+def _refresh_in_background(reason: str) -> bool:
+    """后台生成报告并写入缓存；已有生成任务在执行时直接返回 False"""
+    global _last_background_refresh
+    if not REPORT_REFRESH_LOCK.acquire(blocking=False):
+        return False
+    _last_background_refresh = time.monotonic()
+
+    def _run():
+        try:
+            if not _get_tavily_key():
+                print(f"[WARN] agent initial report refresh ({reason}) skipped: TAVILY_API_KEY missing")
+                return
+            _generate_exclusive(reason)
+        except Exception as exc:
+            print(f"⚠️ 后台刷新日报失败 ({reason}): {exc}")
+        finally:
+            REPORT_REFRESH_LOCK.release()
+
+    threading.Thread(target=_run, name="agent-report-refresh", daemon=True).start()
+    return True
+
+
+def _schedule_next_refresh() -> None:
+    delay = _seconds_until_next_run() + random.uniform(0, max(AGENT_REPORT_SCHEDULER_JITTER, 0))
+    timer = threading.Timer(delay, _scheduled_refresh)
+    timer.daemon = True
+    timer.start()
+
+
+def _scheduled_refresh() -> None:
+    try:
+        if AGENT_REPORT_GENERATION_ENABLED:
+            _refresh_in_background("scheduled")
+    finally:
+        _schedule_next_refresh()
+
+
+def _ensure_scheduler() -> None:
+    """首次请求时在当前 worker 内启动定时刷新（fork 之后启动，preload 模式下也能在每个 worker 中运行）"""
+    global _scheduler_started
+    if _scheduler_started or not AGENT_REPORT_SCHEDULER_ENABLED:
+        return
+    with _scheduler_lock:
+        if _scheduler_started:
+            return
+        _schedule_next_refresh()
+        _scheduler_started = True
+
+
+def _query_report_source(columns: str, limit: int) -> List[Dict[str, Any]]:
     query = (
         _supabase.table(AGENT_REPORT_SOURCE)
-        .select("*")
+        .select(columns)
         .order("priority", desc=False)
         .order("updated_at", desc=True)
     )
     if limit > 0:
         query = query.limit(limit)
-    res = query.execute()
-    rows = res.data or []
+    return query.execute().data or []
+
+
+def _fetch_from_supabase(limit: int) -> Tuple[str, List[Dict[str, Any]]]:
+    if not _supabase:
+        raise RuntimeError("Supabase client not available")
+
+    try:
+        rows = _query_report_source(AGENT_REPORT_SOURCE_COLUMNS, limit)
+    except Exception as exc:
+        # 42703: undefined_column，视图结构与默认列清单不一致
+        if AGENT_REPORT_SOURCE_COLUMNS == "*" or "42703" not in str(exc):
+            raise
+        print(f"⚠️ {AGENT_REPORT_SOURCE} 缺少部分列，回退为 select(*): {exc}")
+        rows = _query_report_source("*", limit)
 
     if not rows:
         raise ValueError("no rows in Supabase result")
@@ -543,22 +763,23 @@ def _fetch_from_supabase(limit: int) -> Tuple[str, List[Dict[str, Any]]]:
     generated_candidates: List[str] = []
 
     for row in rows:
-        section_id = row.get("id")
-        title = row.get("title")
-        content = row.get("content")
-        icon = row.get("icon")
-
+        get = row.get
+        section_id, title, content = get("id"), get("title"), get("content")
         if section_id is None or not title or not content:
             continue
 
-        priority_val = row.get("priority")
         try:
-            priority_int = int(priority_val)
+            priority_int = int(get("priority"))
         except Exception:
             priority_int = 99
 
-        updated_at = row.get("updated_at") or row.get("updatedAt")
-        formatted_updated = _to_iso(updated_at) or _to_iso(row.get("created_at"))
+        updated_at = (
+            _to_iso(get("updated_at") or get("updatedAt"))
+            or _to_iso(get("created_at"))
+            or _FALLBACK_GENERATED_AT
+        )
+        icon = get("icon")
+        sources = get("sources")
 
         sections.append(
             {
@@ -567,13 +788,12 @@ def _fetch_from_supabase(limit: int) -> Tuple[str, List[Dict[str, Any]]]:
                 "icon": str(icon) if icon else "el-icon-reading",
                 "content": str(content),
                 "priority": priority_int,
-                "updatedAt": formatted_updated or _FALLBACK_GENERATED_AT,
-                "sources": row.get("sources") if isinstance(row.get("sources"), list) else [],
+                "updatedAt": updated_at,
+                "sources": sources if isinstance(sources, list) else [],
             }
         )
 
-        generated_raw = row.get("generated_at") or row.get("generatedAt")
-        formatted_generated = _to_iso(generated_raw)
+        formatted_generated = _to_iso(get("generated_at") or get("generatedAt"))
         if formatted_generated:
             generated_candidates.append(formatted_generated)
 
@@ -596,6 +816,37 @@ def _fallback_report() -> Tuple[str, List[Dict[str, Any]]]:
     return _FALLBACK_GENERATED_AT, _FALLBACK_SECTIONS
 
 
+def _render_body(generated_at: str, sections: List[Dict[str, Any]], source: str) -> bytes:
+    payload = {
+        "code": 200,
+        "message": "success",
+        "data": {
+            "generatedAt": generated_at,
+            "sections": sections,
+        },
+        "source": source,
+    }
+    # orjson 直接输出 UTF-8 bytes（中文不转义）
+    return orjson.dumps(payload, option=_JSON_OPTIONS)
+
+
+# 回退数据固定不变，导入时序列化一次
+_FALLBACK_BODY = _render_body(_FALLBACK_GENERATED_AT, _FALLBACK_SECTIONS, "fallback")
+
+
+def _get_body(generated_at: str, sections: List[Dict[str, Any]], source: str) -> bytes:
+    """sections 来自进程内缓存时复用已序列化的响应体，缓存命中不再重复序列化"""
+    with REPORT_CACHE_LOCK:
+        payload = REPORT_CACHE_STATE.get("payload")
+        if payload is None or payload["sections"] is not sections:
+            return _render_body(generated_at, sections, source)
+        bodies = REPORT_CACHE_STATE["bodies"]
+        body = bodies.get(source)
+        if body is None:
+            body = bodies[source] = _render_body(generated_at, sections, source)
+        return body
+
+
 @agent_report_bp.route("/initial-report", methods=["GET"])
 def get_agent_initial_report():
     force_refresh = False
@@ -606,14 +857,27 @@ def get_agent_initial_report():
     except Exception:
         force_refresh = False
 
+    _ensure_scheduler()
+
+    # TAVILY_API_KEY 在导入时读取，缺失时已由 app._warn_missing_keys 在启动时提示，不再逐请求打印
     tavily_key = _get_tavily_key()
-    if not tavily_key:
-        print("[WARN] TAVILY_API_KEY missing; Tavily fetch disabled")
 
     can_generate = bool(tavily_key) and (AGENT_REPORT_GENERATION_ENABLED or force_refresh)
+    result: Optional[Tuple[str, List[Dict[str, Any]], str]] = None
     try:
-        generated_at, sections, source = _get_cached_or_refresh(force_refresh, can_generate)
+        result = _get_cached_report(force_refresh)
     except Exception:
+        result = None
+    if can_generate:
+        if result is None or (force_refresh and _is_recent(result[0], timedelta(hours=AGENT_REPORT_STALE_HOURS))):
+            # 没有任何缓存（首次部署）或显式 refresh=1 且缓存较新：请求内生成，与后台刷新共用进程锁与数据库租约
+            result = _refresh_in_foreground("request") or result
+        elif result[2] == "cache-stale" and time.monotonic() - _last_background_refresh >= _STALE_REFRESH_INTERVAL:
+            # stale-while-revalidate：先返回旧缓存，刷新放到后台（失败后间隔一段时间再重试）
+            _refresh_in_background("stale")
+    if result is not None:
+        generated_at, sections, source = result
+    else:
         try:
             generated_at, sections = _fetch_from_supabase(AGENT_REPORT_LIMIT)
             source = "remote"
@@ -621,24 +885,15 @@ def get_agent_initial_report():
             generated_at, sections = _fallback_report()
             source = "fallback"
 
-    payload = {
-        "code": 200,
-        "message": "success",
-        "data": {
-            "generatedAt": generated_at,
-            "sections": sections,
-        },
-        "source": source,
-    }
-
     try:
         print(f"[INFO] agent initial report source={source} generatedAt={generated_at}")
     except Exception:
         pass
 
-    response = make_response(json.dumps(payload, ensure_ascii=False, indent=2))
+    body = _FALLBACK_BODY if source == "fallback" else _get_body(generated_at, sections, source)
+    response = make_response(body)
     response.status_code = 200
-    response.mimetype = "application/json; charset=utf-8"
+    response.mimetype = "application/json"
     return response
 
 
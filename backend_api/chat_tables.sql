@@ -16,11 +16,43 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     CONSTRAINT fk_session FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
 );
 
+-- 删除会话接口只删除 chat_sessions 一行，消息依赖上面的 ON DELETE CASCADE 级联删除。
+-- 早期建表时若未带级联外键，可执行：
+--   ALTER TABLE chat_messages DROP CONSTRAINT IF EXISTS fk_session;
+--   ALTER TABLE chat_messages ADD CONSTRAINT fk_session
+--     FOREIGN KEY (session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE;
+
 -- 创建索引以提高查询性能
-CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id);
+-- 按会话取历史（session_id 过滤 + created_at 排序 + limit）走复合索引范围扫描，无需额外排序；
+-- 该索引同时覆盖仅按 session_id 的查询，单列索引不再需要
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_created ON chat_messages(session_id, created_at);
+DROP INDEX IF EXISTS idx_chat_messages_session_id;
 CREATE INDEX IF NOT EXISTS idx_chat_messages_created_at ON chat_messages(created_at);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at);
 
+-- 聊天记录批量持久化：一批消息（可跨多个会话）涉及的会话 upsert 与消息写入在同一事务中完成，
+-- 后端合并一段时间内的多轮对话后只需一次 RPC
+-- p_messages: [{"id"?, "session_id", "role", "content", "created_at"}, ...]
+DROP FUNCTION IF EXISTS chat_persist_turn(UUID, TEXT, JSONB);
+CREATE OR REPLACE FUNCTION chat_persist_turns(p_messages JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO chat_sessions (id, title, updated_at)
+    SELECT DISTINCT (m->>'session_id')::UUID, '新对话', NOW()
+    FROM jsonb_array_elements(p_messages) AS m
+    ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, updated_at = EXCLUDED.updated_at;
+
+    INSERT INTO chat_messages (id, session_id, role, content, created_at)
+    SELECT
+        COALESCE((m->>'id')::UUID, gen_random_uuid()),
+        (m->>'session_id')::UUID,
+        m->>'role',
+        m->>'content',
+        COALESCE((m->>'created_at')::TIMESTAMPTZ, NOW())
+    FROM jsonb_array_elements(p_messages) AS m;
+$$;
+
 -- 添加注释
 COMMENT ON TABLE chat_sessions IS '聊天会话表，存储每个对话会话的基本信息';
 COMMENT ON TABLE chat_messages IS '聊天消息表，存储每个会话中的所有消息';
@@ -251,7 +251,7 @@ def get_daily_report():
             "highlights": highlights
         }
     }
-    response = make_response(json.dumps(response_data, ensure_ascii=False, indent=2))
+    response = make_response(json.dumps(response_data, ensure_ascii=False))
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
     return response
@@ -279,14 +279,14 @@ def get_monthly_report():
                 "items": items,
             },
         }
-        response = make_response(json.dumps(response_payload, ensure_ascii=False, indent=2))
+        response = make_response(json.dumps(response_payload, ensure_ascii=False))
         response.status_code = 200
         response.mimetype = 'application/json; charset=utf-8'
         return response
     except Exception as exc:  # pragma: no cover
         print(f"[ERROR] get_monthly_report: {exc}")
         error_payload = {"code": 500, "message": "internal server error", "data": {}}
-        response = make_response(json.dumps(error_payload, ensure_ascii=False, indent=2))
+        response = make_response(json.dumps(error_payload, ensure_ascii=False))
         response.status_code = 500
         response.mimetype = 'application/json; charset=utf-8'
         return response
@@ -300,7 +300,7 @@ def update_daily_report_view():
     v = (body.get("view") or "").strip()
     if v not in ALLOWED_VIEWS:
         error_data = {"code": 400, "message": "invalid view", "data": {}}
-        response = make_response(json.dumps(error_data, ensure_ascii=False, indent=2))
+        response = make_response(json.dumps(error_data, ensure_ascii=False))
         response.status_code = 400
         response.mimetype = 'application/json; charset=utf-8'
         return response
@@ -308,7 +308,7 @@ def update_daily_report_view():
     CURRENT_VIEW["view"] = v
     now_iso = to_iso_utc(datetime.now(timezone.utc))
     response_data = {"code": 200, "message": "success", "data": {"view": v, "updatedAt": now_iso}}
-    response = make_response(json.dumps(response_data, ensure_ascii=False, indent=2))
+    response = make_response(json.dumps(response_data, ensure_ascii=False))
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
     return response
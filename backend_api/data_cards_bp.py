@@ -261,7 +261,7 @@ def get_data_cards_latest():
         "message": "success",
         "data": {"date": anchor_date.isoformat(), "period": period, "cards": cards}
     }
-    response = make_response(json.dumps(response_data, ensure_ascii=False, indent=2))
+    response = make_response(json.dumps(response_data, ensure_ascii=False))
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
     return response
@@ -314,7 +314,7 @@ def get_data_cards_trend():
     else:
         error_data = {"code": 400, "message": "invalid cardId", "data": {}}
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 400
         response.mimetype = 'application/json; charset=utf-8'
@@ -326,7 +326,7 @@ def get_data_cards_trend():
         "data": {"cardId": card_id, "period": period, "trendData": pts}
     }
     response = make_response(
-        json.dumps(response_data, ensure_ascii=False, indent=2)
+        json.dumps(response_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
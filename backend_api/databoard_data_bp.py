@@ -36,6 +36,14 @@ from dateutil.relativedelta import relativedelta
 from flask import Blueprint, make_response, request
 from infra.db import supabase
 
+try:
+    import ormsgpack
+except ImportError:  # 已列入 requirements.txt；缺失时只返回 JSON，导入时提示一次
+    ormsgpack = None
+    print(f"[WARN] ormsgpack 未安装，{__name__} 收到 Accept: application/msgpack 时仍返回 JSON")
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
 # ===================== 初始化 =====================
 databoard_data_bp = Blueprint("databoard_data", __name__)
 
@@ -83,17 +91,29 @@ RESEARCH_COLORS = ["#5470C6", "#91CC75", "#EE6666", "#3BA272"]  # 4个分类的
 COMP_TYPE_ORDER = ["融资", "市场活动", "技术更新", "合作签约", "其他动态"]
 
 # ===================== 工具函数 =====================
+def _wants_msgpack() -> bool:
+    """客户端显式声明 Accept: application/msgpack 时返回二进制响应（体积更小）"""
+    if ormsgpack is None:
+        return False
+    return request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+
 def _json_ok(data: Any, code: int = 200, message: str = "success", http_status: int = 200):
     payload = {"code": code, "message": message, "data": data}
-    resp = make_response(json.dumps(payload, ensure_ascii=False, indent=2))
+    if _wants_msgpack():
+        resp = make_response(ormsgpack.packb(payload, option=ormsgpack.OPT_NON_STR_KEYS))
+        resp.mimetype = MSGPACK_MIMETYPE
+    else:
+        resp = make_response(json.dumps(payload, ensure_ascii=False))
+        resp.mimetype = "application/json; charset=utf-8"
     resp.status_code = http_status
-    resp.mimetype = "application/json; charset=utf-8"
+    resp.vary.add("Accept")
     return resp
 
 
 def _json_err(code: int, message: str, http_status: int = 400, data: Optional[dict] = None):
     payload = {"code": code, "message": message, "data": data or {}}
-    resp = make_response(json.dumps(payload, ensure_ascii=False, indent=2))
+    resp = make_response(json.dumps(payload, ensure_ascii=False))
     resp.status_code = http_status
     resp.mimetype = "application/json; charset=utf-8"
     return resp
@@ -11,7 +11,7 @@ Databoard · 地图模块 API Blueprint
 实现风格与现有 data_cards Blueprint 保持一致：
 - 使用 Supabase（PostgREST）作为数据源
 - 统一响应：{"code": 20000, "message": "success", "data": {...}}
-- 使用 make_response 保证 UTF-8 与易读缩进
+- 使用 make_response 保证 UTF-8 输出；请求头 Accept: application/msgpack 时返回 MessagePack（ormsgpack）
 - 提供尽可能健壮的入参解析与时间窗口计算
 
 ⚠️ 注意
@@ -33,6 +33,14 @@ from flask import Blueprint, jsonify, request, make_response
 
 from infra.db import supabase
 
+try:
+    import ormsgpack
+except ImportError:  # 已列入 requirements.txt；缺失时只返回 JSON，导入时提示一次
+    ormsgpack = None
+    print(f"[WARN] ormsgpack 未安装，{__name__} 收到 Accept: application/msgpack 时仍返回 JSON")
+
+MSGPACK_MIMETYPE = "application/msgpack"
+
 # ===================== 初始化 =====================
 databoard_map_bp = Blueprint("databoard_map", __name__)
 
@@ -167,16 +175,27 @@ def _get_latest_date_from_db() -> date_cls:
     return today
 
 # ===================== 工具函数 =====================
+def _wants_msgpack() -> bool:
+    """客户端显式声明 Accept: application/msgpack 时返回二进制响应（体积更小）"""
+    if ormsgpack is None:
+        return False
+    return request.accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
 def _json_ok(data: Any, code: int = 20000, message: str = "success", http_status: int = 200):
     payload = {"code": code, "message": message, "data": data}
-    resp = make_response(json.dumps(payload, ensure_ascii=False, indent=2))
+    if _wants_msgpack():
+        resp = make_response(ormsgpack.packb(payload, option=ormsgpack.OPT_NON_STR_KEYS))
+        resp.mimetype = MSGPACK_MIMETYPE
+    else:
+        resp = make_response(json.dumps(payload, ensure_ascii=False))
+        resp.mimetype = "application/json; charset=utf-8"
     resp.status_code = http_status
-    resp.mimetype = "application/json; charset=utf-8"
+    resp.vary.add("Accept")
     return resp
 
 def _json_err(code: int, message: str, http_status: int = 400, data: Optional[dict] = None):
     payload = {"code": code, "message": message, "data": data or {}}
-    resp = make_response(json.dumps(payload, ensure_ascii=False, indent=2))
+    resp = make_response(json.dumps(payload, ensure_ascii=False))
     resp.status_code = http_status
     resp.mimetype = "application/json; charset=utf-8"
     return resp
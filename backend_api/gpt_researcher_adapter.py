@@ -9,6 +9,8 @@ import os
 import json
 import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import asyncio
 import websockets
 import queue
@@ -25,6 +27,20 @@ GPT_RESEARCHER_REPORT_ENDPOINT = f"{GPT_RESEARCHER_BASE_URL}/report/"  # 用于
 GPT_RESEARCHER_WS_URL = GPT_RESEARCHER_BASE_URL.replace("http://", "ws://").replace("https://", "wss://") + "/ws"  # WebSocket 端点
 # 增加超时时间：研究任务可能需要 5-10 分钟
 GPT_RESEARCHER_TIMEOUT = int(os.getenv("GPT_RESEARCHER_TIMEOUT", "600"))  # 从 300 秒增加到 600 秒（10分钟）
+GPT_RESEARCHER_POOL_MAXSIZE = int(os.getenv("GPT_RESEARCHER_POOL_MAXSIZE", "32"))
+
+
+def _build_http_session() -> requests.Session:
+    """复用 TCP/TLS 连接的 Session；仅对建连失败重试，研究请求本身不重放"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=GPT_RESEARCHER_POOL_MAXSIZE,
+        max_retries=Retry(total=2, connect=2, read=0, backoff_factor=0.3),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
 
 class GPTResearcherAdapter:
@@ -35,6 +51,7 @@ class GPTResearcherAdapter:
         self.chat_endpoint = f"{self.base_url}/api/chat"  # 保留用于聊天场景
         self.report_endpoint = f"{self.base_url}/report/"  # 用于生成研究报告
         self.timeout = GPT_RESEARCHER_TIMEOUT
+        self.session = _build_http_session()
     
     def _convert_to_gpt_researcher_chat_format(
         self, 
@@ -57,7 +74,7 @@ class GPTResearcherAdapter:
         request_data = self._convert_to_gpt_researcher_chat_format(messages, report)
         
         logger.info(f"回退到 GPT-Researcher /api/chat 端点: {self.chat_endpoint}")
-        response = requests.post(
+        response = self.session.post(
             self.chat_endpoint,
             json=request_data,
             timeout=self.timeout,
@@ -342,7 +359,7 @@ class GPTResearcherAdapter:
                 logger.info(f"研究任务: {request_data['task'][:50]}...")
                 
                 try:
-                    response = requests.post(
+                    response = self.session.post(
                         self.report_endpoint,
                         json=request_data,
                         timeout=self.timeout,
@@ -374,7 +391,7 @@ class GPTResearcherAdapter:
                 request_data = self._convert_to_gpt_researcher_chat_format(messages, report)
                 
                 logger.info(f"调用 GPT-Researcher /api/chat 端点: {self.chat_endpoint}")
-                response = requests.post(
+                response = self.session.post(
                     self.chat_endpoint,
                     json=request_data,
                     timeout=self.timeout,
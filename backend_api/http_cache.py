@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP 条件请求工具
+----------------
+app._apply_http_cache（白名单 GET 接口）与聊天记录接口共用：按响应体计算弱 ETag，
+客户端 If-None-Match 命中时把响应改为 304 空响应体。
+"""
+
+import hashlib
+
+from flask import Response, request
+
+
+def apply_weak_etag(response: Response, cache_control: str) -> Response:
+    """设置 Cache-Control 与弱 ETag；If-None-Match 命中时原地改为 304 并清空响应体"""
+    response.headers["Cache-Control"] = cache_control
+    etag = hashlib.blake2b(response.get_data(), digest_size=8).hexdigest()
+    response.set_etag(etag, weak=True)
+    # flask-compress 会给 ETag 追加 ":br"/":gzip" 后缀，比较时去掉
+    client_tags = request.if_none_match.as_set(include_weak=True)
+    if any(tag.split(":", 1)[0] == etag for tag in client_tags):
+        response.status_code = 304
+        response.set_data(b"")
+    return response
@@ -310,7 +310,7 @@ def get_news_list():
     
     # 使用自定义JSON编码器确保中文字符正确显示
     response = make_response(
-        json.dumps(response_data, ensure_ascii=False, indent=2)
+        json.dumps(response_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
@@ -342,7 +342,7 @@ def get_news_detail(news_id: str):
     if not res or not getattr(res, "data", None):
         error_data = {"code": 404, "message": "not found", "data": {}}
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 404
         response.mimetype = 'application/json; charset=utf-8'
@@ -415,7 +415,7 @@ def get_news_detail(news_id: str):
     
     # 使用自定义JSON编码器确保中文字符正确显示
     response = make_response(
-        json.dumps(response_data, ensure_ascii=False, indent=2)
+        json.dumps(response_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
@@ -10,27 +10,35 @@ def _truncate(text: str, limit: int = SUMMARY_LIMIT) -> str:
     return text
 
 
+EVIDENCE_HEADER = "以下为检索到的相关事件，请仅基于这些信息回答："
+
+
+def format_evidence_item(idx: int, item: Dict) -> List[str]:
+    """Format a single retrieval result into evidence lines."""
+    title = item.get("title") or "未提供标题"
+    url = item.get("url") or ""
+    summary = _truncate(item.get("summary", ""))
+    similarity = item.get("similarity")
+    sim_text = f"{float(similarity):.3f}" if similarity is not None else "未知"
+    published_at = item.get("published_at") or "时间未知"
+    source = item.get("source") or "来源未知"
+
+    header = f"{idx}. {title}（时间：{published_at}，来源：{source}，相似度：{sim_text}）"
+    if url:
+        header += f" | 链接：{url}"
+    if summary:
+        return [header, f"   摘要：{summary}"]
+    return [header]
+
+
 def build_evidence_block(items: List[Dict]) -> str:
     """Format retrieval results into an evidence string for prompting."""
     if not items:
         return "未检索到相关事件。若证据不足，请直接说明“当前事件库未查到足够信息”，不要编造。"
 
-    lines: List[str] = ["以下为检索到的相关事件，请仅基于这些信息回答："]
+    lines: List[str] = [EVIDENCE_HEADER]
     for idx, item in enumerate(items, start=1):
-        title = item.get("title") or "未提供标题"
-        url = item.get("url") or ""
-        summary = _truncate(item.get("summary", ""))
-        similarity = item.get("similarity")
-        sim_text = f"{float(similarity):.3f}" if similarity is not None else "未知"
-        published_at = item.get("published_at") or "时间未知"
-        source = item.get("source") or "来源未知"
-
-        header = f"{idx}. {title}（时间：{published_at}，来源：{source}，相似度：{sim_text}）"
-        if url:
-            header += f" | 链接：{url}"
-        lines.append(header)
-        if summary:
-            lines.append(f"   摘要：{summary}")
+        lines.extend(format_evidence_item(idx, item))
 
     return "\n".join(lines)
 
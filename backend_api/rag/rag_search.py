@@ -1,11 +1,13 @@
 import threading
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-from supabase import Client
-
-from infra.db import supabase
 from infra.embeddings import embed
 
+from backend_api.supabase_client import get_supabase
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 DEFAULT_TOPK = 8
 DEFAULT_MIN_SIM = 0.4
 RPC_TIMEOUT = 20
@@ -27,7 +29,7 @@ def _log_retrieval(k: int, min_sim: float, results: List[Dict[str, Any]]):
     )
 
 
-def _call_rpc_with_timeout(client: Client, rpc: str, payload: Dict[str, Any], timeout: int):
+def _call_rpc_with_timeout(client: "Client", rpc: str, payload: Dict[str, Any], timeout: int):
     result_holder: Dict[str, Any] = {}
 
     def _worker():
@@ -61,7 +63,7 @@ def run_semantic_retrieval(
     if not query:
         return []
 
-    client = supabase
+    client = get_supabase()
     if not client:
         return []
 
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+聊天回答缓存（进程内）
+--------------------
+两级缓存，上下文（系统提示 + 历史 + 调用选项）一致时直接复用回答，跳过 LLM 调用：
+  1. 精确匹配：(上下文, user_message) 的哈希完全相同，一次字典查找，不需要向量化
+  2. 语义匹配：对 user_message 做向量化，与近期已回答的问题做余弦相似度比较，超过阈值即命中
+     进程内未命中且开启 SEMANTIC_CACHE_SHARED 时，再通过 Supabase pgvector RPC 查询共享缓存，
+     多个 worker / 实例之间共用已生成的回答（表结构见 agent_cache_tables.sql）
+
+环境变量:
+  EXACT_CACHE_ENABLED        是否启用精确匹配缓存（默认 false）
+  EXACT_CACHE_TTL            精确匹配缓存有效期秒数（默认 3600）
+  EXACT_CACHE_MAX_SIZE       精确匹配缓存最多条数，超出按 LRU 淘汰（默认 10000）
+  SEMANTIC_CACHE_ENABLED     是否启用语义缓存（默认 false）
+  SEMANTIC_CACHE_THRESHOLD   命中阈值（余弦相似度，默认 0.92）
+  SEMANTIC_CACHE_TTL         缓存有效期秒数（默认 3600）
+  SEMANTIC_CACHE_MAX_SIZE    最多缓存条数，超出按 LRU 淘汰（默认 1024）
+  SEMANTIC_CACHE_SHARED      是否启用 Supabase pgvector 共享语义缓存（默认 false）
+  SEMANTIC_CACHE_TABLE       共享缓存表名（默认 agent_chat_semantic_cache）
+  SEMANTIC_CACHE_MATCH_RPC   共享缓存相似度查询函数（默认 match_chat_semantic_cache）
+
+向量与 RAG 检索共用 infra.embeddings.embed。进程内语义缓存是一个预分配的 float32 矩阵
+（SEMANTIC_CACHE_MAX_SIZE 行，每行一条归一化向量，相当于 FAISS IndexFlatIP），写入时原地更新对应行；
+查询时一次矩阵-向量乘法得到全部内积，锁只用于取候选槽位快照和校验命中行，不覆盖相似度计算。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from infra.embeddings import embed
+
+from backend_api.supabase_client import get_supabase
+
+
+def _get_env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+
+def _get_env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except Exception:
+        return default
+
+
+EXACT_CACHE_ENABLED = os.getenv("EXACT_CACHE_ENABLED", "false").lower() == "true"
+EXACT_CACHE_TTL = _get_env_int("EXACT_CACHE_TTL", 3600)
+EXACT_CACHE_MAX_SIZE = _get_env_int("EXACT_CACHE_MAX_SIZE", 10000)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = _get_env_float("SEMANTIC_CACHE_THRESHOLD", 0.92)
+SEMANTIC_CACHE_TTL = _get_env_int("SEMANTIC_CACHE_TTL", 3600)
+SEMANTIC_CACHE_MAX_SIZE = _get_env_int("SEMANTIC_CACHE_MAX_SIZE", 1024)
+SEMANTIC_CACHE_SHARED = os.getenv("SEMANTIC_CACHE_SHARED", "false").lower() == "true"
+SEMANTIC_CACHE_TABLE = os.getenv("SEMANTIC_CACHE_TABLE", "agent_chat_semantic_cache")
+SEMANTIC_CACHE_MATCH_RPC = os.getenv("SEMANTIC_CACHE_MATCH_RPC", "match_chat_semantic_cache")
+
+logger = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+# 向量矩阵：第 slot 行为该槽位问题的归一化向量；首次写入时按向量维度分配，维度变化时重建
+_MATRIX: Optional[np.ndarray] = None
+# slot -> (context_key, 回答, 过期时间)，按 LRU 顺序排列（末尾最近使用）
+_ENTRIES: "OrderedDict[int, Tuple[str, str, float]]" = OrderedDict()
+# context_key -> 该上下文下的槽位；查询只比较同一上下文的问题
+_CTX_SLOTS: Dict[str, Set[int]] = {}
+_FREE_SLOTS: List[int] = []
+# 精确匹配：hash(context_key, user_message) -> (回答, 过期时间)
+_EXACT: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+# 共享缓存写入放到后台，不占用响应时间
+_SHARED_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+
+def context_key(messages: List[Dict[str, Any]], **extra: Any) -> str:
+    """除最后一条用户消息外的上下文指纹；上下文不同的问题不能共用回答"""
+    raw = json.dumps([messages[:-1], extra], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _exact_key(user_message: str, ctx_key: str) -> str:
+    return hashlib.blake2b(f"{ctx_key}\0{user_message}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _exact_lookup(key: str) -> Optional[str]:
+    with _LOCK:
+        entry = _EXACT.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del _EXACT[key]
+            return None
+        _EXACT.move_to_end(key)
+        return entry[0]
+
+
+def _exact_store(key: str, response_text: str) -> None:
+    with _LOCK:
+        _EXACT[key] = (response_text, time.time() + EXACT_CACHE_TTL)
+        _EXACT.move_to_end(key)
+        while len(_EXACT) > EXACT_CACHE_MAX_SIZE:
+            _EXACT.popitem(last=False)
+
+
+@lru_cache(maxsize=256)
+def _embed_normalized(text: str) -> Optional[np.ndarray]:
+    vector = embed(text)
+    if not vector:
+        return None
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    if not norm:
+        return None
+    arr /= norm
+    # lru_cache 会把同一个数组返回给多个调用方，设为只读防止被意外修改
+    arr.setflags(write=False)
+    return arr
+
+
+def _drop_slot(slot: int) -> None:
+    """释放一个槽位（调用方持有 _LOCK）"""
+    entry = _ENTRIES.pop(slot, None)
+    if entry is None:
+        return
+    slots = _CTX_SLOTS.get(entry[0])
+    if slots is not None:
+        slots.discard(slot)
+        if not slots:
+            del _CTX_SLOTS[entry[0]]
+    _FREE_SLOTS.append(slot)
+
+
+def _local_lookup(query: np.ndarray, ctx_key: str) -> Optional[str]:
+    with _LOCK:
+        matrix = _MATRIX
+        slots = _CTX_SLOTS.get(ctx_key)
+        if matrix is None or not slots or matrix.shape[1] != query.shape[0]:
+            return None
+        candidates = np.fromiter(slots, dtype=np.intp, count=len(slots))
+
+    # 不持锁计算全部内积；并发写入只会影响正在被覆盖的行，命中行在下面持锁复核
+    scores = matrix @ query
+    slot = int(candidates[int(scores[candidates].argmax())])
+
+    with _LOCK:
+        entry = _ENTRIES.get(slot)
+        if entry is None or entry[0] != ctx_key or _MATRIX is not matrix:
+            return None
+        if entry[2] <= time.time():
+            _drop_slot(slot)
+            return None
+        score = float(matrix[slot] @ query)
+        if score < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        _ENTRIES.move_to_end(slot)
+    logger.info("♻️ 语义缓存命中 (similarity=%.3f)", score)
+    return entry[1]
+
+
+def _shared_lookup(query: np.ndarray, ctx_key: str) -> Optional[str]:
+    client = get_supabase()
+    if not client:
+        return None
+    payload = {
+        "p_context_key": ctx_key,
+        "p_embedding": query.tolist(),
+        "p_threshold": SEMANTIC_CACHE_THRESHOLD,
+    }
+    try:
+        res = client.rpc(SEMANTIC_CACHE_MATCH_RPC, payload).execute()
+    except Exception as exc:
+        logger.warning("⚠️ 共享语义缓存查询失败: %s", exc)
+        return None
+    rows = res.data or []
+    if not rows or not isinstance(rows, list):
+        return None
+    row = rows[0]
+    response_text = row.get("response")
+    if not response_text:
+        return None
+    logger.info("♻️ 共享语义缓存命中 (similarity=%.3f)", float(row.get("similarity") or 0))
+    return response_text
+
+
+def _shared_store(user_message: str, ctx_key: str, vector: np.ndarray, response_text: str) -> None:
+    client = get_supabase()
+    if not client:
+        return
+    now = datetime.now(timezone.utc)
+    payload = {
+        "context_key": ctx_key,
+        "query": user_message,
+        "embedding": vector.tolist(),
+        "response": response_text,
+        "created_at": now.isoformat(),
+        "expires_at": (now + timedelta(seconds=SEMANTIC_CACHE_TTL)).isoformat(),
+    }
+    try:
+        client.table(SEMANTIC_CACHE_TABLE).insert(payload, returning="minimal").execute()
+    except Exception as exc:
+        logger.warning("⚠️ 共享语义缓存写入失败: %s", exc)
+
+
+def _local_store(ctx_key: str, vector: np.ndarray, response_text: str) -> None:
+    global _MATRIX
+    if SEMANTIC_CACHE_MAX_SIZE <= 0:
+        return
+    with _LOCK:
+        if _MATRIX is None or _MATRIX.shape[1] != vector.shape[0]:
+            # 首次写入或向量模型维度变化：按新维度重新分配矩阵，旧条目全部作废
+            _MATRIX = np.zeros((SEMANTIC_CACHE_MAX_SIZE, vector.shape[0]), dtype=np.float32)
+            _ENTRIES.clear()
+            _CTX_SLOTS.clear()
+            _FREE_SLOTS[:] = range(SEMANTIC_CACHE_MAX_SIZE - 1, -1, -1)
+        if not _FREE_SLOTS:
+            _drop_slot(next(iter(_ENTRIES)))
+        slot = _FREE_SLOTS.pop()
+        _MATRIX[slot] = vector
+        _ENTRIES[slot] = (ctx_key, response_text, time.time() + SEMANTIC_CACHE_TTL)
+        _CTX_SLOTS.setdefault(ctx_key, set()).add(slot)
+
+
+def lookup(user_message: str, ctx_key: str) -> Optional[str]:
+    """命中时返回缓存的回答，否则返回 None；先查精确匹配，未命中再做语义匹配"""
+    if not user_message:
+        return None
+    if EXACT_CACHE_ENABLED:
+        cached = _exact_lookup(_exact_key(user_message, ctx_key))
+        if cached is not None:
+            logger.info("♻️ 精确缓存命中")
+            return cached
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    try:
+        query = _embed_normalized(user_message)
+    except Exception as exc:
+        logger.warning("⚠️ 语义缓存向量化失败: %s", exc)
+        return None
+    if query is None:
+        return None
+
+    cached = _local_lookup(query, ctx_key)
+    if cached is not None or not SEMANTIC_CACHE_SHARED:
+        return cached
+    cached = _shared_lookup(query, ctx_key)
+    if cached is not None:
+        # 回填进程内缓存，同一 worker 再次命中时不必访问数据库
+        _local_store(ctx_key, query, cached)
+    return cached
+
+
+def store(user_message: str, ctx_key: str, response_text: str) -> None:
+    """写入一条问答；向量在 lookup 时已计算过，这里直接复用"""
+    if not user_message or not response_text:
+        return
+    if EXACT_CACHE_ENABLED:
+        _exact_store(_exact_key(user_message, ctx_key), response_text)
+    if not SEMANTIC_CACHE_ENABLED:
+        return
+    try:
+        vector = _embed_normalized(user_message)
+    except Exception as exc:
+        logger.warning("⚠️ 语义缓存向量化失败: %s", exc)
+        return
+    if vector is None:
+        return
+
+    _local_store(ctx_key, vector, response_text)
+    if SEMANTIC_CACHE_SHARED:
+        _SHARED_WRITER.submit(_shared_store, user_message, ctx_key, vector, response_text)
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Supabase 客户端延迟加载
+----------------------
+导入 infra.db 即会创建客户端；聊天、联网搜索缓存、RAG 检索与语义缓存统一通过 get_supabase()
+在第一次访问数据库时才导入，导入这些模块本身不再触发客户端创建。
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_client = None
+_ready = False
+_lock = threading.Lock()
+
+
+def get_supabase():
+    """返回 infra.db 中的共享客户端；首次调用时导入（双重检查加锁），失败时返回 None，下次调用重试"""
+    global _client, _ready
+    if _ready:
+        return _client
+    with _lock:
+        if not _ready:
+            try:
+                from infra.db import supabase
+            except Exception as exc:
+                logger.warning("⚠️ Supabase 客户端初始化失败: %s", exc)
+                return None
+            _client = supabase
+            _ready = True
+    return _client
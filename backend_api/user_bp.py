@@ -2,7 +2,7 @@
 """
 Flask 后端：用户认证 API Blueprint
 依赖:
-    pip install flask flask_cors
+    pip install flask
 """
 
 import json
@@ -49,7 +49,7 @@ def user_login():
             "message": "Username is required"
         }
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 400
         response.mimetype = 'application/json; charset=utf-8'
@@ -65,7 +65,7 @@ def user_login():
             "message": "Account and password are incorrect."
         }
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 200
         response.mimetype = 'application/json; charset=utf-8'
@@ -77,7 +77,7 @@ def user_login():
         "data": token_info
     }
     response = make_response(
-        json.dumps(success_data, ensure_ascii=False, indent=2)
+        json.dumps(success_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
@@ -94,7 +94,7 @@ def get_user_info():
             "message": "Token is required"
         }
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 400
         response.mimetype = 'application/json; charset=utf-8'
@@ -110,7 +110,7 @@ def get_user_info():
             "message": "Login failed, unable to get user details."
         }
         response = make_response(
-            json.dumps(error_data, ensure_ascii=False, indent=2)
+            json.dumps(error_data, ensure_ascii=False)
         )
         response.status_code = 200
         response.mimetype = 'application/json; charset=utf-8'
@@ -122,7 +122,7 @@ def get_user_info():
         "data": user_info
     }
     response = make_response(
-        json.dumps(success_data, ensure_ascii=False, indent=2)
+        json.dumps(success_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
@@ -136,7 +136,7 @@ def user_logout():
         "data": "success"
     }
     response = make_response(
-        json.dumps(success_data, ensure_ascii=False, indent=2)
+        json.dumps(success_data, ensure_ascii=False)
     )
     response.status_code = 200
     response.mimetype = 'application/json; charset=utf-8'
@@ -8,12 +8,35 @@ from typing import Dict, List, Optional
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from infra.db import supabase as _supabase
+from backend_api.supabase_client import get_supabase
 
 _CACHE_LOCK = threading.Lock()
 _CACHE: Dict[str, Dict[str, object]] = {}
 WEB_SEARCH_CACHE_TABLE = os.getenv("WEB_SEARCH_CACHE_TABLE", "agent_web_search_cache")
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
+
+def _build_http_session() -> requests.Session:
+    # 复用到 Tavily 的 keep-alive 连接（聊天联网搜索与智能体报告栏目生成共用）；搜索请求无副作用，429/5xx 时可安全重试
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+TAVILY_HTTP = _build_http_session()
 
 
 def _now_ts() -> float:
@@ -94,12 +117,13 @@ def _cache_hash(value: str) -> str:
 
 
 def _db_get_cache(cache_hash: str) -> Optional[Dict[str, object]]:
-    if not _supabase:
+    client = get_supabase()
+    if not client:
         return None
     now_iso = _to_iso(datetime.now(timezone.utc))
     try:
         res = (
-            _supabase.table(WEB_SEARCH_CACHE_TABLE)
+            client.table(WEB_SEARCH_CACHE_TABLE)
             .select("results, expires_at")
             .eq("query_hash", cache_hash)
             .gt("expires_at", now_iso)
@@ -120,7 +144,8 @@ def _db_get_cache(cache_hash: str) -> Optional[Dict[str, object]]:
 
 
 def _db_set_cache(query: str, cache_hash: str, results: List[Dict[str, object]], ttl_seconds: int) -> None:
-    if not _supabase:
+    client = get_supabase()
+    if not client:
         return
     now = datetime.now(timezone.utc)
     payload = {
@@ -131,7 +156,7 @@ def _db_set_cache(query: str, cache_hash: str, results: List[Dict[str, object]],
         "expires_at": _to_iso(now + timedelta(seconds=ttl_seconds)),
     }
     try:
-        _supabase.table(WEB_SEARCH_CACHE_TABLE).insert(payload).execute()
+        client.table(WEB_SEARCH_CACHE_TABLE).insert(payload).execute()
     except Exception:
         pass
 
@@ -212,7 +237,7 @@ def search_web(
         "include_raw_content": False,
     }
 
-    response = requests.post("https://api.tavily.com/search", json=payload, timeout=25)
+    response = TAVILY_HTTP.post(TAVILY_SEARCH_URL, json=payload, timeout=(5, 25))
     response.raise_for_status()
     data = response.json() or {}
     raw_results = data.get("results") or []
@@ -241,22 +266,26 @@ def search_web(
     return normalized
 
 
+def format_web_evidence_item(idx: int, item: Dict[str, object]) -> List[str]:
+    title = item.get("title") or "未提供标题"
+    url = item.get("url") or ""
+    snippet = item.get("snippet") or ""
+    published_at = item.get("publishedAt") or "时间未知"
+    source = item.get("source") or "来源未知"
+    header = f"{idx}. {title}（时间：{published_at}，来源：{source}）"
+    if url:
+        header += f" | 链接：{url}"
+    if snippet:
+        return [header, f"   摘要：{snippet}"]
+    return [header]
+
+
 def build_web_evidence_block(results: List[Dict[str, object]]) -> str:
     if not results:
         return ""
     lines = ["【网络搜索】"]
     for idx, item in enumerate(results, start=1):
-        title = item.get("title") or "未提供标题"
-        url = item.get("url") or ""
-        snippet = item.get("snippet") or ""
-        published_at = item.get("publishedAt") or "时间未知"
-        source = item.get("source") or "来源未知"
-        header = f"{idx}. {title}（时间：{published_at}，来源：{source}）"
-        if url:
-            header += f" | 链接：{url}"
-        lines.append(header)
-        if snippet:
-            lines.append(f"   摘要：{snippet}")
+        lines.extend(format_web_evidence_item(idx, item))
     return "\n".join(lines)
 
 
@@ -7,7 +7,8 @@
 
 import os
 import json
-from typing import Dict, List, Any, Optional
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
 
 # 配置文件路径
 CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -104,8 +105,15 @@ def build_system_prompt(temporary_prompts: Optional[List[str]] = None) -> str:
     return '\n\n'.join(all_prompts)
 
 
+@lru_cache(maxsize=256)
+def build_system_prompt_cached(temporary_prompts: Tuple[str, ...] = ()) -> str:
+    """按临时提示词组合缓存 build_system_prompt 的结果（reload_config 时清空）"""
+    return build_system_prompt(temporary_prompts=list(temporary_prompts))
+
+
 def reload_config():
     """重新加载配置（用于热更新）"""
     global _cached_config
     _cached_config = None
+    build_system_prompt_cached.cache_clear()
     return load_prompts_config()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn 生产配置
+-----------------
+启动：gunicorn -c gunicorn.conf.py app:app
+
+各 Blueprint 基本都是 I/O 密集型（Supabase / LLM / Tavily），默认使用 gevent worker：
+gunicorn 会在加载应用前执行 monkey.patch_all()，阻塞 socket 调用在等待期间让出，
+单个 worker 可同时处理大量请求（含 SSE 长连接）。
+Supabase 通过 HTTP(httpx) 访问，无需额外的数据库驱动补丁。
+
+流式聊天（/api/agent/chat/stream）是同步生成器：在 gevent worker 下每个 chunk 直接写回 socket。
+请勿改用 uvicorn + asgiref.WsgiToAsgi 托管本应用，否则同步生成器的每次迭代都会被转交线程池，
+SSE 吞吐会明显下降。
+同理也无需把视图改写为 Quart / async def：gevent 下等待 LLM 或 Supabase 响应的请求只占用一个 greenlet，
+并发上限由 worker_connections 决定，而不是线程数。
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:7003")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+# 流式聊天/研究任务耗时较长，避免被 worker 超时误杀
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# --preload：master 进程导入一次应用再 fork，worker 共享已加载的模块（写时复制），启动更快、内存更省。
+# Supabase / Redis / HTTP 客户端的连接都在首次请求时才建立，fork 后各 worker 各自持有连接，不会共用 socket。
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+if preload_app and worker_class == "gevent":
+    # 应用在 master 中导入，必须先打补丁：否则导入期创建的锁、队列、线程池都是未打补丁的原生对象，
+    # 在 worker 中会阻塞整个 gevent hub
+    from gevent import monkey
+
+    monkey.patch_all()
+# 访问日志 / 错误日志直接写 stdout/stderr，由容器统一收集
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "-")